@@ -1,18 +1,35 @@
 import os
-import requests
 import zipfile
-import glob
+from fnmatch import fnmatch
 from datetime import datetime, timedelta, UTC
-from tqdm import tqdm
 import shutil
+from download import download_files
+import metrics
 
 # ---- CONFIG ----
 BASE_EFFECTIVE_DATE = datetime(2026, 2, 19, tzinfo=UTC)  # AIRAC 2602
 BASE_AIRAC = (2026, 2)
 CYCLE_LENGTH = 28
 DATA_ROOT = "data"
+# Overridable so downloads can be pointed at a local mirror or test server
+NASR_BASE_URL = os.getenv("NASR_BASE_URL", "https://nfdc.faa.gov/webContent/28DaySub")
+PREFROUTES_URL = os.getenv("PREFROUTES_URL", "https://www.fly.faa.gov/rmt/data_file/prefroutes_db.csv")
 # ----------------
 
+# NASR CSV files the pipeline reads (datasets.py and procedure.py); nothing
+# else in the subscription is extracted
+NASR_CSV_FILES = (
+    "FIX_BASE.csv",
+    "NAV_BASE.csv",
+    "AWY_BASE.csv",
+    "APT_BASE.csv",
+    "DP_BASE.csv",
+    "DP_RTE.csv",
+    "STAR_BASE.csv",
+    "STAR_RTE.csv",
+)
+NESTED_CSV_ZIP = "CSV_DATA/*_CSV.zip"
+
 
 def calculate_current_airac(today=None):
     if today is None:
@@ -36,25 +53,32 @@ def calculate_current_airac(today=None):
     return f"{str(year)[-2:]}{cycle:02d}", effective_date
 
 
-def download_with_progress(url, output_path):
-    headers = {"User-Agent": "Mozilla/5.0"}
+def airac_effective_date(airac):
+    # Inverse of calculate_current_airac, e.g. "2603" -> 2026-03-19
+    year, cycle = 2000 + int(airac[:2]), int(airac[2:])
+    base_year, base_cycle = BASE_AIRAC
+
+    cycle_offset = (year - base_year) * 13 + (cycle - base_cycle)
+    return BASE_EFFECTIVE_DATE + timedelta(days=cycle_offset * CYCLE_LENGTH)
+
+
+def previous_airac(airac):
+    effective_date = airac_effective_date(airac)
+    return calculate_current_airac(effective_date - timedelta(days=CYCLE_LENGTH))[0]
+
+
+def next_airac(airac):
+    effective_date = airac_effective_date(airac)
+    return calculate_current_airac(effective_date + timedelta(days=CYCLE_LENGTH))[0]
 
-    with requests.get(url, headers=headers, stream=True) as r:
-        r.raise_for_status()
-        total_size = int(r.headers.get('content-length', 0))
 
-        with open(output_path, "wb") as f, tqdm(
-            desc="Downloading",
-            total=total_size,
-            unit="B",
-            unit_scale=True,
-            unit_divisor=1024,
-        ) as bar:
+def download_with_progress(url, output_path):
+    download_files([(url, output_path, "Downloading")])
+
 
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    bar.update(len(chunk))
+def nasr_url(effective_date):
+    date_str = effective_date.strftime("%Y-%m-%d")
+    return f"{NASR_BASE_URL}/28DaySubscription_Effective_{date_str}.zip"
 
 
 def download_and_extract_airac(airac, effective_date):
@@ -68,67 +92,62 @@ def download_and_extract_airac(airac, effective_date):
 
     os.makedirs(airac_folder, exist_ok=True)
 
-    date_str = effective_date.strftime("%Y-%m-%d")
-    url = f"https://nfdc.faa.gov/webContent/28DaySub/28DaySubscription_Effective_{date_str}.zip"
     zip_path = os.path.join(airac_folder, "nasr.zip")
-
-    print(f"\nDownloading AIRAC {airac}")
-    download_with_progress(url, zip_path)
-
-    print("\nExtracting ZIP...")
-
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(airac_folder)
-
-    # nested folder
-
-    csv_zip_pattern = os.path.join(airac_folder, "CSV_DATA", "*_CSV.zip")
-    csv_zip_files = glob.glob(csv_zip_pattern)
-
-    if not csv_zip_files:
-        raise FileNotFoundError("Could not find nested CSV ZIP inside CSV_DATA folder.")
-
-    nested_csv_zip = csv_zip_files[0]
-
-    print(f"Extracting nested CSV ZIP: {os.path.basename(nested_csv_zip)}")
-
-
-    os.makedirs(csv_folder, exist_ok=True)
+    faa_path = os.path.join(airac_folder, "faa.csv")
+
+    # NASR ZIP and preferred routes are independent, fetch them together
+    print(f"\nDownloading AIRAC {airac} and FAA preferred routes")
+    with metrics.stage("download") as stage:
+        download_files([
+            (nasr_url(effective_date), zip_path, "NASR"),
+            (PREFROUTES_URL, faa_path, "faa.csv"),
+        ])
+        stage.bytes_written = metrics.file_bytes([zip_path, faa_path])
+
+    # Extract next to csv/ and rename at the end, so a failed run isn't mistaken for a finished one
+    tmp_folder = f"{csv_folder}.tmp"
+    os.makedirs(tmp_folder, exist_ok=True)
     os.makedirs(json_folder, exist_ok=True)
 
-    with zipfile.ZipFile(nested_csv_zip, 'r') as zip_ref:
-        zip_ref.extractall(csv_folder)
+    with metrics.stage("extract"):
+        extract_nasr_csvs(zip_path, tmp_folder)
 
-    download_preferred_routes(csv_folder)
+    shutil.move(faa_path, os.path.join(tmp_folder, "faa.csv"))
+    os.replace(tmp_folder, csv_folder)
 
     cleanup_airac_folder(airac_folder)
 
     print(f"AIRAC {airac} CSV data ready in {csv_folder}")
 
-def download_preferred_routes(csv_output_folder):
-    url = "https://www.fly.faa.gov/rmt/data_file/prefroutes_db.csv"
-    output_path = os.path.join(csv_output_folder, "faa.csv")
+def extract_nasr_csvs(zip_path, csv_folder, members=NASR_CSV_FILES):
+    # Copy only the CSVs we use out of the nested *_CSV.zip, read in place
+    # inside the NASR ZIP, so neither archive is ever unpacked to disk
+    with zipfile.ZipFile(zip_path, 'r') as outer:
+        nested = [name for name in outer.namelist() if fnmatch(name, NESTED_CSV_ZIP)]
+        if not nested:
+            raise FileNotFoundError("Could not find nested CSV ZIP inside CSV_DATA folder.")
 
-    print("Downloading FAA preferred routes database...")
+        print(f"Extracting from nested CSV ZIP: {os.path.basename(nested[0])}")
 
-    headers = {"User-Agent": "Mozilla/5.0"}
+        with outer.open(nested[0]) as nested_file, zipfile.ZipFile(nested_file, 'r') as zip_ref:
+            infos = {os.path.basename(info.filename): info for info in zip_ref.infolist()}
+            missing = [member for member in members if member not in infos]
+            if missing:
+                raise FileNotFoundError(f"Missing from nested CSV ZIP: {', '.join(missing)}")
 
-    with requests.get(url, headers=headers, stream=True) as r:
-        r.raise_for_status()
-        total_size = int(r.headers.get("content-length", 0))
+            # In archive order, so the nested (compressed) stream is only read forwards
+            for info in sorted((infos[member] for member in members), key=lambda i: i.header_offset):
+                with zip_ref.open(info) as src, open(os.path.join(csv_folder, os.path.basename(info.filename)), "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                metrics.add(bytes_read=info.compress_size, bytes_written=info.file_size)
 
-        with open(output_path, "wb") as f, tqdm(
-            desc="Downloading faa.csv",
-            total=total_size,
-            unit="B",
-            unit_scale=True,
-            unit_divisor=1024,
-        ) as bar:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    bar.update(len(chunk))
+def download_preferred_routes(csv_output_folder):
+    output_path = os.path.join(csv_output_folder, "faa.csv")
 
+    print("Downloading FAA preferred routes database...")
+    with metrics.stage("download:faa") as stage:
+        download_files([(PREFROUTES_URL, output_path, "Downloading faa.csv")])
+        stage.bytes_written = metrics.file_bytes([output_path])
     print("Preferred routes saved as faa.csv")
 
 def cleanup_airac_folder(airac_folder, keep_folders=("csv", "json")):
@@ -0,0 +1,84 @@
+import asyncio, json, os, time
+import metrics
+
+# ---- CONFIG ----
+MAX_ROWS = int(os.getenv("DB_BATCH_ROWS", "5000"))  # rows per create_many call
+MAX_BYTES = int(os.getenv("DB_BATCH_BYTES", str(4 * 1024 * 1024)))  # estimated payload per call
+IN_FLIGHT = int(os.getenv("DB_IN_FLIGHT", "2"))  # batches outstanding per table
+RETRIES = 3
+BACKOFF = 1.0  # seconds, doubled after every failed attempt
+# ----------------
+
+
+def row_size(row):
+    # Rough size of the row in the query payload
+    return len(json.dumps(row, default=str))
+
+
+def sized_batches(rows, max_rows=MAX_ROWS, max_bytes=MAX_BYTES):
+    # Split rows on whichever limit is hit first; a single oversized row still gets its own batch
+    batch, size = [], 0
+    for row in rows:
+        n = row_size(row)
+        if batch and (len(batch) >= max_rows or size + n > max_bytes):
+            metrics.add(bytes_written=size)
+            yield batch
+            batch, size = [], 0
+        batch.append(row)
+        size += n
+
+    if batch:
+        metrics.add(bytes_written=size)
+        yield batch
+
+
+async def send_with_retry(send, batch, label, number, retries=RETRIES, backoff=BACKOFF):
+    for attempt in range(retries + 1):
+        try:
+            return await send(batch)
+        except Exception as e:
+            if attempt == retries:
+                print(f"{label}: batch {number} failed after {retries + 1} attempts")
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"{label}: batch {number} failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def collect(done):
+    # Retrieve every finished batch so no failure goes unreported, then raise the first
+    errors = [task.exception() for task in done if task.exception()]
+    if errors:
+        raise errors[0]
+    return sum(task.result() for task in done)
+
+
+async def send_batches(send, rows, label, max_rows=MAX_ROWS, max_bytes=MAX_BYTES, in_flight=IN_FLIGHT,
+                       retries=RETRIES, backoff=BACKOFF):
+    # Send rows through `send(batch) -> count`, keeping up to `in_flight` batches
+    # outstanding. Returns the sum of the counts.
+    start = time.perf_counter()
+    total, sent = 0, 0
+    pending = set()
+
+    try:
+        for number, batch in enumerate(sized_batches(rows, max_rows, max_bytes), 1):
+            if len(pending) >= in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                total += collect(done)
+
+            sent += len(batch)
+            pending.add(asyncio.create_task(send_with_retry(send, batch, label, number, retries, backoff)))
+
+        if pending:
+            done, pending = await asyncio.wait(pending)
+            total += collect(done)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    elapsed = time.perf_counter() - start
+    rate = sent / elapsed if elapsed else 0
+    print(f"{label}: sent {sent} rows in {elapsed:.2f}s ({rate:.0f} rows/s)")
+    metrics.add(rows_out=total)
+    return total
@@ -0,0 +1,160 @@
+import argparse, json, os, shutil, sys, tempfile
+import metrics
+from datasets import DATASETS, csv_path, json_path, dataset_sources, source_path
+from expand import expansion_tables
+from records import TABLE_DATASETS, table_rows
+from sinks import SQLiteSink, write_rows
+from sid import parse_sid
+from snapshot import write_snapshot
+from star import parse_star
+from synthetic import generate
+from utils import csv_to_json, write_json
+
+# Offline benchmark of the pipeline on synthetic NASR-sized inputs (see
+# synthetic.py). Every stage main.py runs is timed through metrics.py, with
+# the database loads going into the SQLite sink (sinks.py) as a stand-in,
+# and compared with the stored baseline:
+#
+#   python benchmark.py                     # 1x, fails on a regression
+#   python benchmark.py --scale 1 5 20
+#   python benchmark.py --update-baseline   # after an intended change
+#
+# A stage regresses when it is more than TOLERANCE times slower than the
+# baseline (and by more than MIN_DELTA seconds), or writes a different number
+# of rows. The baseline is machine specific, record it on the box that runs
+# the comparison.
+
+# ---- CONFIG ----
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "1.5"))
+MIN_DELTA = float(os.getenv("BENCH_MIN_DELTA", "0.25"))  # seconds, below this it's noise
+AIRAC = "9901"  # synthetic cycle, never a real one
+# ----------------
+
+# db.TABLES, without importing the Prisma client
+TABLES = list(TABLE_DATASETS)
+
+
+def run_pipeline(scale):
+    # Every stage of a cycle on generated inputs, in the current directory
+    with metrics.stage("generate") as stage:
+        generate(AIRAC, scale)
+        stage.bytes_written = metrics.file_bytes(
+            [path for name in DATASETS for path in dataset_sources(AIRAC, name)]
+        )
+
+    parsed = {
+        "sid": parse_sid(source_path(AIRAC, "DP_BASE.csv"), source_path(AIRAC, "DP_RTE.csv")),
+        "star": parse_star(source_path(AIRAC, "STAR_BASE.csv"), source_path(AIRAC, "STAR_RTE.csv")),
+    }
+
+    for name, dataset in DATASETS.items():
+        with metrics.stage(f"json:{name}", bytes_read=metrics.file_bytes(dataset_sources(AIRAC, name))) as stage:
+            if name in parsed:
+                write_json(parsed[name], json_path(AIRAC, name))
+            else:
+                csv_to_json(csv_path(AIRAC, name), json_path(AIRAC, name), dataset["fields"])
+            stage.bytes_written = metrics.file_bytes([json_path(AIRAC, name)])
+
+    with metrics.stage("records"):
+        tables = {table: list(table_rows(AIRAC, table, True, parsed)) for table in TABLES}
+
+    with metrics.stage("expand") as stage:
+        expanded, expanded_kinds = expansion_tables(tables)
+        stage.rows_out = sum(len(rows) for rows in expanded.values())
+
+    path = f"data/{AIRAC}/navdata.snap"
+    with metrics.stage("snapshot") as stage:
+        write_snapshot(path, {**tables, **expanded}, expanded_kinds)
+        stage.bytes_written = metrics.file_bytes([path])
+
+    sink = SQLiteSink(f"data/{AIRAC}/bench.sqlite3")
+    try:
+        for table in TABLES:
+            with metrics.stage(f"load:{table}") as stage:
+                stage.rows_out = write_rows(sink, table, tables[table])
+    finally:
+        sink.close()
+
+
+def run_scale(scale, workdir=None):
+    # {stage: {wall_seconds, rows_out}} for one scale, run in a scratch directory
+    metrics.STAGES.clear()
+    cwd = os.getcwd()
+    workdir = workdir or tempfile.mkdtemp(prefix=f"navbench-{scale}x-")
+    try:
+        os.chdir(workdir)
+        run_pipeline(scale)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        stage.name: {"wall_seconds": stage.wall, "cpu_seconds": stage.cpu, "peak_rss_mb": stage.peak_rss_mb,
+                     "rows_out": stage.rows_out}
+        for stage in metrics.STAGES
+    }
+
+
+def compare(scale, results, baseline):
+    # Regression messages for one scale; stages missing from the baseline are only reported
+    problems = []
+    print(f"\n{scale}x:")
+    for name, result in results.items():
+        base = baseline.get(name)
+        line = f"  {name:<14} {result['wall_seconds']:8.2f}s  {result['rows_out']:>9} rows"
+        if base is None:
+            print(f"{line}  (no baseline)")
+            continue
+
+        ratio = result["wall_seconds"] / base["wall_seconds"] if base["wall_seconds"] else 1.0
+        print(f"{line}  baseline {base['wall_seconds']:8.2f}s  x{ratio:.2f}")
+        if name == "generate":
+            continue
+        if ratio > TOLERANCE and result["wall_seconds"] - base["wall_seconds"] > MIN_DELTA:
+            problems.append(f"{scale}x {name}: {result['wall_seconds']:.2f}s vs {base['wall_seconds']:.2f}s baseline "
+                            f"(x{ratio:.2f}, limit x{TOLERANCE})")
+        if result["rows_out"] != base["rows_out"]:
+            problems.append(f"{scale}x {name}: wrote {result['rows_out']} rows, baseline {base['rows_out']}")
+    return problems
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic NASR-sized data.")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1], help="multiples of NASR size (e.g. 1 5 20)")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    problems = []
+    for scale in args.scale:
+        results = run_scale(scale)
+        problems += compare(scale, results, baseline.get(f"{scale}x", {}))
+        baseline[f"{scale}x"] = results
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if problems:
+        print("\nPERFORMANCE REGRESSION:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import hashlib, json, os
+from functools import lru_cache
+
+# Per-cycle manifest (data/<airac>/manifest.json) of the input hashes each
+# stage last ran with. A stage whose inputs hash the same as last time, and
+# whose outputs are still there, can be skipped. "load:<table>" entries
+# describe what was loaded into the database from this folder, so point a
+# fresh database at the cycle with FORCE=1.
+
+
+@lru_cache(maxsize=None)
+def _file_hash(path, mtime_ns, size):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_hash(path):
+    # Hashed once per process unless the file changes
+    stat = os.stat(path)
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+def inputs_hash(paths, extra=""):
+    digest = hashlib.sha256(extra.encode())
+    for path in paths:
+        digest.update(f"{os.path.basename(path)}:{file_hash(path)}\n".encode())
+    return digest.hexdigest()
+
+
+class Manifest:
+    def __init__(self, airac: str, force: bool = False):
+        self.path = f"data/{airac}/manifest.json"
+        self.force = force
+        self.stages = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.stages = json.load(f).get("stages", {})
+
+    def is_current(self, stage: str, inputs, outputs=()):
+        if self.force or stage not in self.stages:
+            return False
+        if not all(os.path.exists(path) for path in outputs):
+            return False
+        return self.stages[stage]["inputs"] == inputs_hash(inputs)
+
+    def mark(self, stage: str, inputs):
+        self.stages[stage] = {"inputs": inputs_hash(inputs)}
+        self.save()
+
+    def unmark(self, stage: str):
+        if self.stages.pop(stage, None) is not None:
+            self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"stages": self.stages}, f, indent=4)
+        os.replace(tmp_path, self.path)
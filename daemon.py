@@ -0,0 +1,178 @@
+import asyncio, json, os, time
+from datetime import datetime, timedelta, UTC
+from airac import (DATA_ROOT, airac_effective_date, calculate_current_airac, download_preferred_routes, nasr_url,
+                   next_airac)
+from cache import Manifest
+from datasets import source_path
+from db import swap_staged, TABLES
+from download import url_available
+import pipeline
+from validate import ValidationError, failure_summary
+
+# Long-running mode. The FAA posts each 28-day subscription ahead of its
+# effective date, so instead of downloading, parsing and loading a cycle once
+# it's already live, the daemon:
+#   - polls for the next cycle's NASR ZIP and, once it's there, downloads,
+#     parses and stages it (update(stage=True, swap=False))
+#   - swaps the staged tables in at 0901Z on the effective date
+#   - refreshes the preferred routes (faa.csv) of the live cycle on their own
+#     schedule, and right after every swap
+# Its state (which cycle is live or staged, when to check next) is kept in
+# data/daemon.json, so a restart picks up where it left off, including a swap
+# that was due while it was down.
+
+# ---- CONFIG ----
+SWAP_TIME = timedelta(hours=9, minutes=1)  # after midnight UTC on the effective date
+PREFETCH_POLL = timedelta(hours=float(os.getenv("PREFETCH_POLL_HOURS", "6")))
+PREFROUTES_INTERVAL = timedelta(hours=float(os.getenv("PREFROUTES_INTERVAL_HOURS", "24")))
+RETRY_DELAY = timedelta(minutes=15)  # after a failed step
+SWAP_ATTEMPTS = 3  # failed swaps before the staged cycle is dropped and loaded directly
+MAX_SLEEP = timedelta(hours=1)
+STATE_PATH = os.path.join(DATA_ROOT, "daemon.json")
+# ----------------
+
+
+def swap_time(airac):
+    return airac_effective_date(airac) + SWAP_TIME
+
+
+def live_airac(now):
+    # Cycle that should be in the database at `now`; it only changes at 0901Z
+    return calculate_current_airac(now - SWAP_TIME)[0]
+
+
+def read_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def timestamp(state, key):
+    value = state.get(key)
+    return datetime.fromisoformat(value) if value else None
+
+
+class Daemon:
+    def __init__(self, workers=pipeline.WORKERS, state_path=STATE_PATH):
+        self.workers = workers
+        self.state_path = state_path
+        self.state = read_state(state_path)
+        self.error = None  # of the last failed step
+
+    def save(self):
+        write_state(self.state, self.state_path)
+
+    def attempt(self, description, func, *args, **kwargs):
+        # Run one step; a failure is logged and retried later instead of stopping the daemon
+        print(f"[{datetime.now(UTC):%Y-%m-%d %H:%MZ}] {description}")
+        self.error = None
+        try:
+            func(*args, **kwargs)
+            return True
+        except Exception as e:
+            self.error = repr(e)
+            print(f"{description} failed: {e!r}")
+            if isinstance(e, ValidationError):
+                print(f"{failure_summary(e.report)}\nSee {e.path} for details")
+            return False
+
+    def load_live(self, airac):
+        # Download/parse/load whatever of the live cycle isn't in the database yet
+        pipeline.run_pipeline(airac=airac, workers=self.workers)
+
+    def prefetch(self, airac):
+        # Everything up to the swap: download, parse and stage (not swapped).
+        # Only stale tables get staged, so remember which ones have a <Table>_new
+        summary = pipeline.run_pipeline(airac=airac, workers=self.workers, staging=True, swap=False)
+        self.state["staged_tables"] = summary.get("load", {}).get("postgres", [])
+
+    def swap(self, airac):
+        tables = self.state.get("staged_tables", TABLES)
+        if tables:
+            asyncio.run(swap_staged(airac, tables, Manifest(airac)))
+
+    def refresh_prefroutes(self, airac):
+        # Applied as a diff against the live table rather than staged, so a
+        # cycle staged in the meantime is left alone and Route is never empty
+        download_preferred_routes(os.path.dirname(source_path(airac, "faa.csv")))
+        pipeline.run_pipeline(airac=airac, stages=("parse", "validate", "load"), targets=["route"], workers=self.workers,
+                              staging=False, diff="db")
+
+    def step(self, now):
+        # Do whatever is due at `now`; returns when to wake up next
+        state = self.state
+        retry = None
+
+        staged = state.get("staged")
+        if staged and now >= swap_time(staged):
+            if self.attempt(f"Swapping in AIRAC {staged}", self.swap, staged):
+                state.update(staged=None, staged_tables=None, swap_failures=None, live=staged,
+                             next_prefroutes=now.isoformat())
+            else:
+                failures = (state.get("swap_failures") or 0) + 1
+                state.update(swap_failures=failures,
+                             last_swap_error={"airac": staged, "at": now.isoformat(), "error": self.error})
+                if failures >= SWAP_ATTEMPTS:
+                    # Stop retrying the same swap; the live-cycle check below loads it directly instead
+                    print(f"Giving up on swapping in AIRAC {staged} after {failures} attempts, loading it instead")
+                    state.update(staged=None, staged_tables=None, swap_failures=None)
+                else:
+                    retry = now + timedelta(minutes=1)
+
+        live = live_airac(now)
+        if state.get("live") != live and state.get("staged") != live:
+            if self.attempt(f"Loading AIRAC {live}", self.load_live, live):
+                state["live"] = live
+            else:
+                retry = now + RETRY_DELAY
+
+        upcoming = next_airac(live)
+        next_check = timestamp(state, "next_prefetch") or now
+        if state.get("staged") != upcoming and now >= next_check:
+            if not url_available(nasr_url(airac_effective_date(upcoming))):
+                print(f"AIRAC {upcoming} isn't published yet, checking again in {PREFETCH_POLL}")
+                state["next_prefetch"] = (now + PREFETCH_POLL).isoformat()
+            elif self.attempt(f"Prefetching and staging AIRAC {upcoming}", self.prefetch, upcoming):
+                state.update(staged=upcoming, next_prefetch=None)
+            else:
+                retry = now + RETRY_DELAY
+
+        next_prefroutes = timestamp(state, "next_prefroutes") or now
+        if now >= next_prefroutes and state.get("live") == live:
+            if self.attempt(f"Refreshing preferred routes for AIRAC {live}", self.refresh_prefroutes, live):
+                state["next_prefroutes"] = (now + PREFROUTES_INTERVAL).isoformat()
+            else:
+                retry = now + RETRY_DELAY
+
+        self.save()
+
+        wake = [now + MAX_SLEEP, swap_time(upcoming), timestamp(state, "next_prefroutes")]
+        if state.get("staged"):
+            wake.append(swap_time(state["staged"]))
+        else:
+            wake.append(timestamp(state, "next_prefetch") or now + PREFETCH_POLL)
+        if retry:
+            wake.append(retry)
+        return min(w for w in wake if w)
+
+    def run(self):
+        print("Nav data daemon started")
+        while True:
+            wake = self.step(datetime.now(UTC))
+            delay = (wake - datetime.now(UTC)).total_seconds()
+            if delay > 0:
+                print(f"Sleeping until {wake:%Y-%m-%d %H:%M:%SZ}")
+                time.sleep(delay)
+
+
+def run(workers=pipeline.WORKERS):
+    Daemon(workers).run()
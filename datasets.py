@@ -0,0 +1,66 @@
+from procedure import PROCEDURES
+
+# Every dataset the pipeline reads: source CSV (in data/<airac>/csv, any of
+# the encodings utils.decoded_lines handles) or the procedure kind it is
+# parsed from (see procedure.py), optional debug JSON output (in
+# data/<airac>/json) and the fields we keep.
+
+DATASETS = {
+    "fixes": {
+        "csv": "FIX_BASE.csv",
+        "json": "fixes.json",
+        "fields": ["FIX_ID", "LAT_DECIMAL", "LONG_DECIMAL"],
+    },
+    "nav": {
+        "csv": "NAV_BASE.csv",
+        "json": "nav.json",
+        "fields": ["NAV_ID", "LAT_DECIMAL", "LONG_DECIMAL", "NAME"],
+    },
+    "awy": {
+        "csv": "AWY_BASE.csv",
+        "json": "awy.json",
+        "fields": ["AWY_ID", "AIRWAY_STRING"],
+    },
+    "apt": {
+        "csv": "APT_BASE.csv",
+        "json": "apt.json",
+        "fields": ["ARPT_ID", "LAT_DECIMAL", "LONG_DECIMAL"],
+    },
+    "sid": {
+        "procedure": "sid",
+        "json": "sid.json",
+        "fields": ["sid_name", "served_arpt", "fixes"],
+    },
+    "star": {
+        "procedure": "star",
+        "json": "star.json",
+        "fields": ["star_name", "served_arpt", "fixes"],
+    },
+    # The prefroutes file comes with a BOM; utils.decoded_lines drops it
+    "faa": {
+        "csv": "faa.csv",
+        "json": "faa.json",
+        "fields": ["Orig", "Route String", "Dest", "Type", "Aircraft", "Direction", "DCNTR", "ACNTR"],
+    },
+}
+
+
+def source_path(airac, filename):
+    return f"data/{airac}/csv/{filename}"
+
+
+def csv_path(airac, name):
+    return source_path(airac, DATASETS[name]["csv"])
+
+
+def json_path(airac, name):
+    return f"data/{airac}/json/{DATASETS[name]['json']}"
+
+
+def dataset_sources(airac, name):
+    # Files a dataset is built from
+    dataset = DATASETS[name]
+    if "procedure" in dataset:
+        spec = PROCEDURES[dataset["procedure"]]
+        return [source_path(airac, spec["base"]), source_path(airac, spec["route"])]
+    return [csv_path(airac, name)]
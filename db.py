@@ -1,134 +1,236 @@
-import json, asyncio
+import asyncio, os, time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from dotenv import load_dotenv
 from prisma import Prisma
-
-async def load_entity(db, airac: str, json_file: str, model_name: str, mapping: dict):
-    file_path = f"data/{airac}/json/{json_file}"
-
-    with open(file_path, "r", encoding="utf-8-sig") as f:
-        data = json.load(f)
-
-    sanitized = []
-    for item in data:
-        row = {db_field: item[csv_field] for csv_field, db_field in mapping.items() if csv_field in item}
-        sanitized.append(row)
-
+from airac import previous_airac
+from batching import IN_FLIGHT, send_batches
+from cache import Manifest
+from diff import diff_records, snapshot_rows, summarize
+from records import KEYS, table_rows, table_sources
+from pg_copy import create_pool, copy_rows
+import metrics
+import sinks as file_sinks
+import staging
+from utils import batched
+
+# Rows per delete_many/update batch; inserts are sized by batching.py
+BATCH_SIZE = 5000
+
+# Load order; fixes and navaids share the fix table
+TABLES = ["airport", "airway", "route", "fix", "sid", "star"]
+
+# Rows this updater owns in each table; hand-maintained routes (source="custom")
+# are never read back, diffed or deleted
+OWNED = {"route": {"source": "faa"}}
+
+load_dotenv()
+
+# Tables loaded at once, each on its own pooled connections (IN_FLIGHT per
+# table). Keep CONCURRENCY * IN_FLIGHT within the pgbouncer pool size when
+# DATABASE_URL goes through pgbouncer.
+CONCURRENCY = int(os.getenv("DB_CONCURRENCY", "4"))
+
+def pooled_url(url: str, connection_limit: int):
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query["connection_limit"] = str(connection_limit)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def connect_client(concurrency: int):
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        return Prisma()
+    return Prisma(datasource={"url": pooled_url(url, concurrency * IN_FLIGHT)})
+
+async def insert_rows(db, model_name: str, rows):
     model = getattr(db, model_name)
 
-    result = await model.create_many(data=sanitized, skip_duplicates=True)
-    print(f"{model_name}: inserted {result} records")
-
-async def load_faa_routes(db, airac: str):
-    file_path = f"data/{airac}/json/faa.json"
-
-    with open(file_path, "r", encoding="utf-8-sig") as f:
-        data = json.load(f)
-
-    sanitized = []
-    for item in data:
-        sanitized.append({
-            "dep": item.get("Orig"),
-            "dest": item.get("Dest"),
-            "route": item.get("Route String"),
-            "altitude": None,
-            "notes": " ".join(filter(None, [item.get("Aircraft"), item.get("Direction")])),
-            "source": "faa",
-        })
-
-    result = await db.route.create_many(data=sanitized, skip_duplicates=True)
-    print(f"FAA routes: inserted {result} records")
-
-async def load_airways(db, airac: str):
-    file_path = f"data/{airac}/json/awy.json"
-
-    with open(file_path, "r", encoding="utf-8-sig") as f:
-        data = json.load(f)
-
-    sanitized = []
-    for item in data:
-        sanitized.append({
-            "awy_code": item.get("AWY_ID"),
-            "fixes": item.get("AIRWAY_STRING", "").split(),
-        })
-
-    result = await db.airway.create_many(data=sanitized, skip_duplicates=True)
-    print(f"Airways: inserted {result} records")
-
-async def load_sids(db, airac: str):
-    file_path = f"data/{airac}/json/sid.json"
-
-    with open(file_path, "r", encoding="utf-8-sig") as f:
-        data = json.load(f)
-
-    sanitized = []
-    for item in data:
-        sanitized.append({
-            "sid_code": item.get("sid_name"),
-            "apts": item.get("served_arpt", "").split(),
-            "fixes": item.get("fixes", "").split(),
-        })
-
-    result = await db.sid.create_many(data=sanitized, skip_duplicates=True)
-    print(f"SIDs: inserted {result} records")
-
-async def load_stars(db, airac: str):
-    file_path = f"data/{airac}/json/star.json"
-
-    with open(file_path, "r", encoding="utf-8-sig") as f:
-        data = json.load(f)
-
-    sanitized = []
-    for item in data:
-        sanitized.append({
-            "star_code": item.get("star_name"),
-            "apts": item.get("served_arpt", "").split(),
-            "fixes": item.get("fixes", "").split(),
-        })
-
-    result = await db.star.create_many(data=sanitized, skip_duplicates=True)
-    print(f"STARs: inserted {result} records")
-
-async def update(airac: str):
+    async def send(batch):
+        return await model.create_many(data=batch, skip_duplicates=True)
+
+    return await send_batches(send, rows, model_name)
+
+async def load_table(db, table: str, rows, pool=None):
+    if pool:
+        result = await copy_rows(pool, table, rows)
+    else:
+        result = await insert_rows(db, table, rows)
+    print(f"{table}: inserted {result} records")
+
+async def current_rows(db, table: str):
+    records = await getattr(db, table).find_many(where=OWNED.get(table))
+    return [record.model_dump() for record in records]
+
+async def apply_diff(db, airac: str, table: str, rows, against: str = "db"):
+    # against="snapshot" compares with the previous cycle's files under data/<airac>/
+    # instead of reading the table back. Route ids only live in the database.
+    if against == "snapshot" and table != "route":
+        old_rows = snapshot_rows(previous_airac(airac), table)
+    else:
+        old_rows = await current_rows(db, table)
+
+    changes = diff_records(table, old_rows, rows)
+    model = getattr(db, table)
+    key = KEYS.get(table, "id")
+
+    for batch in batched(changes.deletes, BATCH_SIZE):
+        await model.delete_many(where={key: {"in": batch}, **OWNED.get(table, {})})
+        metrics.add(rows_out=len(batch))
+
+    for batch in batched(changes.updates, BATCH_SIZE):
+        async with db.batch_() as batcher:
+            for row in batch:
+                data = {field: value for field, value in row.items() if field != key}
+                getattr(batcher, table).update(where={key: row[key]}, data=data)
+        metrics.add(rows_out=len(batch))
+
+    await insert_rows(db, table, changes.inserts)
+
+    print(summarize(table, changes))
+
+async def update_table(db, airac: str, table: str, limit, stream: bool = False, diff: str = None,
+                       stage: bool = False, pool=None, parsed: dict = None, manifest=None, sinks=()):
+    async with limit:
+        start = time.perf_counter()
+
+        with metrics.stage(f"load:{table}", bytes_read=metrics.file_bytes(table_sources(airac, table))):
+            rows = table_rows(airac, table, stream, parsed)
+            if sinks:
+                # every row read for Postgres also goes to the file outputs
+                rows = file_sinks.tee_rows(rows, [sink.writer(table) for sink in sinks])
+            try:
+                if stage:
+                    await staging.stage_table(db, table, rows, pool)
+                elif diff:
+                    await apply_diff(db, airac, table, rows, against=diff)
+                else:
+                    await getattr(db, table).delete_many(where=OWNED.get(table))
+                    await load_table(db, table, rows, pool)
+            finally:
+                if sinks:
+                    # aborts the file outputs if Postgres failed before reading every row
+                    rows.close()
+
+        if manifest and not stage:
+            manifest.mark(f"load:{table}", table_sources(airac, table))
+
+        return table, time.perf_counter() - start
+
+async def update(airac: str, stream: bool = False, diff: str = None, concurrency: int = CONCURRENCY,
+                 stage: bool = False, copy: bool = False, parsed: dict = None, tables=None, manifest=None,
+                 swap: bool = True, sinks: dict = None):
+    # stream=True loads straight from the CSVs in bounded batches, skipping the JSON files.
+    # diff="db" or "snapshot" only writes the rows that changed instead of reloading everything.
+    # stage=True loads into shadow tables and swaps them all in at the end, so the live
+    # tables are never empty or half-filled. With swap=False the staged tables are left
+    # for swap_staged() to make live later.
+    # copy=True writes full loads with COPY over DIRECT_URL instead of create_many.
+    # parsed passes datasets that are already in memory, e.g. {"sid": parse_sid(...)}.
+    # tables limits the update to some tables; with a cache.Manifest each one is
+    # recorded as loaded once it is live. sinks ({table: [sinks.SQLiteSink, ...]})
+    # writes those tables to file outputs as well, from the same rows.
+    # Tables are independent, so up to `concurrency` of them are loaded at once.
+    tables = TABLES if tables is None else tables
+    if not tables:
+        print("Nothing to load, all tables are up to date.")
+        return
+
+    db = connect_client(concurrency)
+    await db.connect()
+    pool = None
+    try:
+        pool = await create_pool(concurrency) if copy else None
+
+        if stage:
+            print("Staging new AIRAC data...")
+        elif diff:
+            print(f"Applying AIRAC changes (against {diff})...")
+        else:
+            print("Replacing nav data...")
+
+        limit = asyncio.Semaphore(concurrency)
+        start = time.perf_counter()
+
+        timings = await asyncio.gather(*(
+            update_table(db, airac, table, limit, stream, diff, stage, pool, parsed, manifest, (sinks or {}).get(table, ()))
+            for table in tables
+        ))
+
+        if stage and swap:
+            await swap_tables(db, airac, tables, manifest)
+        elif stage:
+            print(f"Staged {', '.join(tables)}, waiting to be swapped in")
+    finally:
+        # A failed table must not leave the query engine or the COPY pool behind
+        if pool:
+            await pool.close()
+        await db.disconnect()
+
+    for table, seconds in timings:
+        print(f"  {table:<8} {seconds:7.2f}s")
+    print(f"AIRAC update complete in {time.perf_counter() - start:.2f}s.")
+
+async def swap_tables(db, airac: str, tables, manifest=None):
+    with metrics.stage("swap"):
+        await staging.swap(db, tables)
+    staging.write_swap_record(airac, tables)
+    if manifest:
+        for table in tables:
+            manifest.mark(f"load:{table}", table_sources(airac, table))
+
+async def swap_staged(airac: str, tables=None, manifest=None):
+    # Make tables staged earlier with update(stage=True, swap=False) live
+    db = Prisma()
+    await db.connect()
+    try:
+        await swap_tables(db, airac, TABLES if tables is None else tables, manifest)
+    finally:
+        await db.disconnect()
+
+async def verify(airac: str, tables=None):
+    # Compare each table's row count with what the cycle's files produce;
+    # returns {table: (expected, found)}. Custom routes aren't counted.
+    tables = TABLES if tables is None else tables
     db = Prisma()
     await db.connect()
 
-    print("Clearing existing nav data...")
-
-    await db.fix.delete_many()
-    await db.airway.delete_many()
-    await db.route.delete_many()
-    await db.sid.delete_many()
-    await db.star.delete_many()
-    await db.airport.delete_many()
-
-    print("Loading new AIRAC data...")
-
-    await load_entity(db, airac, "apt.json", "airport", {
-        "ARPT_ID": "code",
-        "LAT_DECIMAL": "lat",
-        "LONG_DECIMAL": "lon"
-    })
-
-    await load_airways(db, airac)
-
-    await load_faa_routes(db, airac)
-
-    await load_entity(db, airac, "fixes.json", "fix", {
-        "FIX_ID": "fix_id",
-        "LAT_DECIMAL": "lat",
-        "LONG_DECIMAL": "lon"
-    })
-
-    await load_entity(db, airac, "nav.json", "fix", {
-        "NAV_ID": "fix_id",
-        "LAT_DECIMAL": "lat",
-        "LONG_DECIMAL": "lon",
-        "NAME": "nav_name"
-    })
-
-    await load_sids(db, airac)
-    await load_stars(db, airac)
-
-    await db.disconnect()
-
-    print("AIRAC update complete.")
+    results = {}
+    try:
+        for table in tables:
+            expected = sum(1 for _ in table_rows(airac, table, stream=True))
+            found = await getattr(db, table).count(where=OWNED.get(table))
+            results[table] = (expected, found)
+            print(f"  {table:<8} expected {expected:>8} found {found:>8}  {'ok' if expected == found else 'MISMATCH'}")
+    finally:
+        await db.disconnect()
+
+    return results
+
+async def rollback(tables=None):
+    # Put the previous cycle's tables back after a staged update. Only the
+    # tables the last swap replaced are rolled back (or `tables`), and their
+    # "load:<table>" entries are dropped so the next run loads them again
+    record = staging.read_swap_record()
+    if tables is None:
+        if record is None:
+            print("No swap to roll back.")
+            return []
+        tables = record["tables"]
 
+    db = Prisma()
+    await db.connect()
+    try:
+        rolled_back = await staging.rollback(db, tables)
+    finally:
+        await db.disconnect()
+
+    if record:
+        manifest = Manifest(record["airac"])
+        for table in rolled_back:
+            manifest.unmark(f"load:{table}")
+        remaining = [table for table in record["tables"] if table not in tables]
+        if remaining:
+            staging.write_swap_record(record["airac"], remaining)
+        else:
+            staging.clear_swap_record()
+    return rolled_back
@@ -0,0 +1,89 @@
+from collections import namedtuple
+from decimal import Decimal
+from records import KEYS, has_json, table_rows
+from snapshot import Snapshot, is_current, snapshot_path
+
+# Columns compared for each table (Route has an autoincrement id, so routes
+# are matched on their full contents instead of a key)
+FIELDS = {
+    "airport": ["code", "lat", "lon", "geohash"],
+    "airway": ["awy_code", "fixes"],
+    "fix": ["fix_id", "lat", "lon", "nav_name", "geohash"],
+    "sid": ["sid_code", "fixes", "apts"],
+    "star": ["star_code", "fixes", "apts"],
+    "route": ["dep", "dest", "route", "altitude", "notes", "source", "aircraft", "direction", "route_type",
+              "dep_artcc", "dest_artcc"],
+}
+
+Diff = namedtuple("Diff", ["inserts", "updates", "deletes"])
+
+
+def normalize(field, value):
+    # The database hands back Decimals and lists, the CSVs strings
+    if value is None:
+        return None
+    if field in ("lat", "lon"):
+        return Decimal(str(value))
+    if isinstance(value, list):
+        return tuple(value)
+    return str(value)
+
+
+def record_values(table, row):
+    return tuple(normalize(field, row.get(field)) for field in FIELDS[table])
+
+
+def diff_records(table, old_rows, new_rows):
+    # inserts/updates are full new rows, deletes are keys (or route ids)
+    if table == "route":
+        return diff_routes(old_rows, new_rows)
+
+    key = KEYS[table]
+    old = {row[key]: row for row in old_rows}
+
+    new = {}
+    for row in new_rows:
+        # first row wins, same as create_many(skip_duplicates=True)
+        new.setdefault(row[key], row)
+
+    inserts, updates = [], []
+    for k, row in new.items():
+        if k not in old:
+            inserts.append(row)
+        elif record_values(table, old[k]) != record_values(table, row):
+            updates.append({field: row.get(field) for field in FIELDS[table]})
+
+    deletes = [k for k in old if k not in new]
+    return Diff(inserts, updates, deletes)
+
+
+def diff_routes(old_rows, new_rows):
+    # Routes may repeat, so match them as a multiset of their contents
+    old = {}
+    for row in old_rows:
+        old.setdefault(record_values("route", row), []).append(row.get("id"))
+
+    inserts = []
+    for row in new_rows:
+        ids = old.get(record_values("route", row))
+        if ids:
+            ids.pop()
+        else:
+            inserts.append(row)
+
+    deletes = [i for ids in old.values() for i in ids]
+    return Diff(inserts, [], deletes)
+
+
+def snapshot_rows(airac: str, table: str):
+    # A previous cycle's rows from data/<airac>/: its navdata.snap if there is
+    # one (of the current version), then JSON if it was kept, CSV otherwise
+    path = snapshot_path(airac)
+    if is_current(path):
+        with Snapshot(path) as snapshot:
+            return list(snapshot.table(table))
+    return table_rows(airac, table, stream=not has_json(airac, table))
+
+
+def summarize(table, diff):
+    return f"{table}: {len(diff.inserts)} inserts, {len(diff.updates)} updates, {len(diff.deletes)} deletes"
@@ -0,0 +1,149 @@
+import asyncio, json, os
+import httpx
+from tqdm import tqdm
+
+# Async downloader: several files at once, resumable with HTTP Range and
+# validated against Content-Length/ETag before being moved into place.
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+RETRIES = 5
+BACKOFF = 2.0  # seconds, doubled after every failed attempt
+TIMEOUT = httpx.Timeout(60.0, connect=30.0)
+
+
+class DownloadError(Exception):
+    pass
+
+
+def chunk_size_for(total):
+    # Bigger files get bigger chunks, within [MIN_CHUNK, MAX_CHUNK]
+    return max(MIN_CHUNK, min(MAX_CHUNK, total // 256))
+
+
+def read_meta(meta_path):
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_meta(meta_path, meta):
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def content_total(response, offset):
+    # Full size of the file from Content-Range (206) or Content-Length (200)
+    if response.status_code == 206:
+        total = response.headers.get("content-range", "").rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else 0
+    return int(response.headers.get("content-length", 0))
+
+
+async def fetch(client, url, part_path, meta_path, desc):
+    # One attempt: resume from whatever is already in part_path
+    meta = read_meta(meta_path)
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) and meta.get("url") == url else 0
+
+    headers = dict(HEADERS)
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if meta.get("etag"):
+            # Server sends the whole file again if it changed since the partial download
+            headers["If-Range"] = meta["etag"]
+
+    async with client.stream("GET", url, headers=headers) as r:
+        if r.status_code == 416 and offset and offset == meta.get("total"):
+            return meta  # already complete
+        r.raise_for_status()
+
+        if r.status_code != 206:
+            offset = 0
+        total = content_total(r, offset)
+        meta = {"url": url, "etag": r.headers.get("etag"), "total": total}
+        write_meta(meta_path, meta)
+
+        with open(part_path, "ab" if offset else "wb") as f, tqdm(
+            desc=desc,
+            initial=offset,
+            total=total,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+        ) as bar:
+            async for chunk in r.aiter_bytes(chunk_size_for(total)):
+                f.write(chunk)
+                bar.update(len(chunk))
+
+    return meta
+
+
+async def download(client, url, output_path, desc="Downloading", retries=RETRIES, backoff=BACKOFF):
+    part_path = f"{output_path}.part"
+    meta_path = f"{output_path}.part.json"
+
+    for attempt in range(retries + 1):
+        try:
+            meta = await fetch(client, url, part_path, meta_path, desc)
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            if status == 416:
+                # Partial file no longer matches the server's, start over
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                continue
+            if status < 500 or attempt == retries:
+                raise DownloadError(f"{desc}: HTTP {status} for {url}") from e
+            delay = backoff * 2 ** attempt
+            print(f"{desc}: server error {status}, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            continue
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise DownloadError(f"{desc}: giving up after {retries + 1} attempts ({e})") from e
+            delay = backoff * 2 ** attempt
+            print(f"{desc}: download interrupted ({e}), resuming in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        size = os.path.getsize(part_path)
+        if meta["total"] and size != meta["total"]:
+            if attempt == retries:
+                raise DownloadError(f"{desc}: got {size} of {meta['total']} bytes")
+            print(f"{desc}: incomplete ({size} of {meta['total']} bytes), resuming")
+            continue
+
+        os.replace(part_path, output_path)
+        os.remove(meta_path)
+        return output_path
+
+    # Only reached when the last attempt started over after a 416
+    raise DownloadError(f"{desc}: giving up after {retries + 1} attempts for {url}")
+
+
+async def download_all(jobs):
+    # jobs: [(url, output_path, desc)], all fetched concurrently
+    async with httpx.AsyncClient(follow_redirects=True, timeout=TIMEOUT) as client:
+        return await asyncio.gather(*(download(client, url, path, desc) for url, path, desc in jobs))
+
+
+async def available(url):
+    # Whether the server has the file yet; asks for one byte instead of a
+    # HEAD, which not every server answers
+    headers = {**HEADERS, "Range": "bytes=0-0"}
+    try:
+        async with httpx.AsyncClient(follow_redirects=True, timeout=TIMEOUT) as client:
+            async with client.stream("GET", url, headers=headers) as r:
+                return r.status_code in (200, 206)
+    except httpx.TransportError:
+        return False
+
+
+def url_available(url):
+    return asyncio.run(available(url))
+
+
+def download_files(jobs):
+    return asyncio.run(download_all(jobs))
@@ -0,0 +1,177 @@
+from collections import defaultdict
+
+# Route expansion: resolves every FAA route string into the full list of
+# fixes it flies, with coordinates, so consumers read one row instead of
+# looking each token up in Fix. Airways are cut between the entry and exit
+# fix, SIDs and STARs are replaced by their transition (or body) fixes.
+#
+# The results are written to the cycle snapshot as two extra tables:
+#   route_path  one row per route, in the same order as the route table
+#   fix_graph   every fix's neighbours and the airway/procedure joining them
+
+ROUTE_PATH_KINDS = {
+    "dep": "str",
+    "dest": "str",
+    "route": "str",
+    "fixes": "strlist",
+    "lats": "f64list",
+    "lons": "f64list",
+    "unresolved": "strlist",
+}
+
+FIX_GRAPH_KINDS = {
+    "fix": "str",
+    "neighbours": "strlist",
+    "via": "strlist",
+}
+
+
+def coordinates(rows, key):
+    points = {}
+    for row in rows:
+        if row.get("lat") not in (None, "") and row.get("lon") not in (None, ""):
+            points.setdefault(row[key], (float(row["lat"]), float(row["lon"])))
+    return points
+
+
+def first_by_name(codes, part):
+    # {procedure name: first code with it}, e.g. KAYLN3 => KAYLN3.KAYLN for SIDs
+    # (part 0) and TPGUN2 => BOBTA.TPGUN2 for STARs (part 1)
+    index = {}
+    for code in codes:
+        parts = code.split(".")
+        if len(parts) == 2:
+            index.setdefault(parts[part], code)
+    return index
+
+
+class RouteGraph:
+    def __init__(self, fixes, airports, airways, sids, stars):
+        self.fixes = coordinates(fixes, "fix_id")
+        self.airports = coordinates(airports, "code")
+
+        self.airways = {row["awy_code"]: row["fixes"] for row in airways}
+        # {airway: {fix: position}}, first occurrence wins
+        self.positions = {}
+        for code, points in self.airways.items():
+            positions = self.positions[code] = {}
+            for i, fix in enumerate(points):
+                positions.setdefault(fix, i)
+
+        self.sids = {row["sid_code"]: row["fixes"] for row in sids}
+        self.stars = {row["star_code"]: row["fixes"] for row in stars}
+        self.sid_names = first_by_name(self.sids, 0)
+        self.star_names = first_by_name(self.stars, 1)
+
+        # {fix: {neighbour: airway or procedure}}
+        self.adjacency = defaultdict(dict)
+        for code, points in self.airways.items():
+            for a, b in zip(points, points[1:]):
+                self.adjacency[a].setdefault(b, code)
+                self.adjacency[b].setdefault(a, code)
+        for procedures in (self.sids, self.stars):
+            for code, points in procedures.items():
+                for a, b in zip(points, points[1:]):
+                    self.adjacency[a].setdefault(b, code)
+
+    def airway_segment(self, code, entry, exit):
+        # Fixes strictly between entry and exit, in flying order
+        positions = self.positions[code]
+        if entry not in positions or exit not in positions:
+            return None
+        i, j = positions[entry], positions[exit]
+        points = self.airways[code]
+        return points[i + 1:j] if i < j else points[j + 1:i][::-1]
+
+    def procedure_fixes(self, token, previous, following):
+        # SID KAYLN3 followed by SMUUV flies KAYLN3.SMUUV, STAR TPGUN2 after
+        # BOBTA flies BOBTA.TPGUN2; without a matching transition, the body
+        if token in self.sids:
+            return self.sids[token]
+        if token in self.stars:
+            return self.stars[token]
+        if token in self.sid_names:
+            return self.sids.get(f"{token}.{following}") or self.sids[self.sid_names[token]]
+        if token in self.star_names:
+            return self.stars.get(f"{previous}.{token}") or self.stars[self.star_names[token]]
+        return None
+
+    def expand(self, dep, route, dest):
+        tokens = (route or "").split()
+        path = []
+        unresolved = []
+
+        def add(ident):
+            if not path or path[-1] != ident:
+                path.append(ident)
+
+        if dep in self.airports:
+            add(dep)
+
+        for i, token in enumerate(tokens):
+            previous = tokens[i - 1] if i else None
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+
+            if token in self.fixes:
+                add(token)
+            elif token in self.airways:
+                segment = self.airway_segment(token, path[-1] if path else None, following)
+                if segment is None:
+                    unresolved.append(token)
+                else:
+                    for fix in segment:
+                        add(fix)
+            elif (fixes := self.procedure_fixes(token, previous, following)) is not None:
+                for fix in fixes:
+                    add(fix)
+            elif token in self.airports:
+                add(token)
+            else:
+                unresolved.append(token)
+
+        if dest in self.airports:
+            add(dest)
+
+        # Airports only resolve at the ends, fixes everywhere else
+        resolved = []
+        for n, ident in enumerate(path):
+            at_end = (n == 0 and ident == dep) or (n == len(path) - 1 and ident == dest)
+            point = self.airports.get(ident) if at_end else None
+            point = point or self.fixes.get(ident) or self.airports.get(ident)
+            if point is None:
+                # airway or procedure fix missing from Fix
+                unresolved.append(ident)
+            else:
+                resolved.append((ident, point))
+
+        return {
+            "dep": dep,
+            "dest": dest,
+            "route": route,
+            "fixes": [ident for ident, _ in resolved],
+            "lats": [point[0] for _, point in resolved],
+            "lons": [point[1] for _, point in resolved],
+            "unresolved": unresolved,
+        }
+
+    def graph_rows(self):
+        for fix, neighbours in self.adjacency.items():
+            yield {"fix": fix, "neighbours": list(neighbours), "via": list(neighbours.values())}
+
+
+def expansion_tables(tables, lazy=False):
+    # tables: {table: [rows]} with at least fix, airport, airway, sid, star and route.
+    # lazy returns generators that expand as they're consumed (e.g. by
+    # write_snapshot), so tables can be read once and paths aren't kept
+    graph = RouteGraph(tables["fix"], tables["airport"], tables["airway"], tables["sid"], tables["star"])
+    kinds = {"route_path": ROUTE_PATH_KINDS, "fix_graph": FIX_GRAPH_KINDS}
+    if lazy:
+        paths = (graph.expand(row["dep"], row["route"], row["dest"]) for row in tables["route"])
+        return {"route_path": paths, "fix_graph": graph.graph_rows()}, kinds
+
+    paths = [graph.expand(row["dep"], row["route"], row["dest"]) for row in tables["route"]]
+
+    unresolved = sum(1 for path in paths if path["unresolved"])
+    print(f"Expanded {len(paths)} routes ({unresolved} with unresolved tokens)")
+
+    return {"route_path": paths, "fix_graph": list(graph.graph_rows())}, kinds
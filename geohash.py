@@ -0,0 +1,42 @@
+# Standard geohash encoding, stored on Fix and Airport so the database can
+# answer "what's near here" with a b-tree range scan on a prefix.
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 6  # ~1.2km x 0.6km cells
+
+
+def encode(lat, lon, precision=PRECISION):
+    lat, lon = float(lat), float(lon)
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            rng[0] = mid
+        else:
+            bits = bits * 2
+            rng[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+
+    return "".join(chars)
+
+
+def prefix_range(prefix):
+    # (low, high) bounds so `geohash >= low AND geohash < high` matches every
+    # geohash starting with prefix, which a plain b-tree index can serve.
+    # high is None when there is no upper bound (prefix is all "z").
+    last = BASE32.index(prefix[-1])
+    if last < len(BASE32) - 1:
+        return prefix, prefix[:-1] + BASE32[last + 1]
+    if len(prefix) == 1:
+        return prefix, None
+    return prefix, prefix_range(prefix[:-1])[1]
@@ -0,0 +1,264 @@
+import hashlib, json, os, sqlite3, zlib
+from array import array
+from datetime import datetime, UTC
+from diff import FIELDS, snapshot_rows
+from records import KEYS
+from snapshot import Snapshot, is_current, snapshot_path
+from spatial import haversine_nm
+
+# Store of every processed cycle (data/history.sqlite), so old cycles can be
+# read and compared without their data/<airac> folders or NASR ZIPs.
+#
+# Records are stored once per distinct content: each table row's FIELDS
+# values are hashed, and a cycle is just the list of record ids it had, kept
+# as zlib-compressed deltas. An unchanged fix, airway or route is shared by
+# every cycle it appears in, so a cycle costs a few bytes per row plus its
+# new and changed records. Long records (airways, procedures) are compressed.
+#
+#   with HistoryStore() as history:
+#       history.archive("2603")
+#       rows = list(history.rows("2601", "fix"))
+#       report = history.diff("2601", "2603")
+#
+# Diffing two cycles compares their record id sets, so only records that
+# were added, removed or changed are read.
+
+# ---- CONFIG ----
+HISTORY_PATH = os.getenv("HISTORY_PATH", "data/history.sqlite")
+COMPRESS_OVER = 128  # bytes of JSON, shorter records are stored as text
+CHANGE_EXAMPLES = int(os.getenv("CHANGE_EXAMPLES", "0"))  # 0 lists every change in the report
+# ----------------
+
+TABLES = list(FIELDS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    tbl TEXT NOT NULL,
+    hash BLOB NOT NULL UNIQUE,
+    key TEXT,
+    data NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cycles (
+    airac TEXT NOT NULL,
+    tbl TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    ids BLOB NOT NULL,
+    archived TEXT NOT NULL,
+    PRIMARY KEY (airac, tbl)
+);
+"""
+
+
+def value(field, v):
+    # Same value whether it came from a snapshot (floats, lists) or a CSV (strings)
+    if v is None or v == "":
+        return None
+    if field in ("lat", "lon"):
+        return float(v)
+    if isinstance(v, (list, tuple)):
+        return [str(item) for item in v]
+    return str(v)
+
+
+def cycle_rows(airac, table):
+    # Streamed from the cycle's snapshot, see diff.snapshot_rows for the fallbacks
+    path = snapshot_path(airac)
+    if not is_current(path):
+        yield from snapshot_rows(airac, table)
+        return
+    with Snapshot(path) as snapshot:
+        yield from snapshot.table(table)
+
+
+def record_key(table, row):
+    if table == "route":
+        return f"{row['dep']}-{row['dest']}"
+    return row[KEYS[table]]
+
+
+def encode_ids(ids):
+    deltas = array("q", [ids[0]] if ids else [])
+    deltas.extend(b - a for a, b in zip(ids, ids[1:]))
+    return zlib.compress(deltas.tobytes())
+
+
+def decode_ids(blob):
+    deltas = array("q")
+    deltas.frombytes(zlib.decompress(blob))
+    ids, total = [], 0
+    for delta in deltas:
+        total += delta
+        ids.append(total)
+    return ids
+
+
+def encode_record(values):
+    text = json.dumps(values, separators=(",", ":"))
+    return zlib.compress(text.encode()) if len(text) > COMPRESS_OVER else text
+
+
+def decode_record(table, data):
+    if isinstance(data, bytes):
+        data = zlib.decompress(data).decode()
+    return dict(zip(FIELDS[table], json.loads(data)))
+
+
+class HistoryStore:
+    def __init__(self, path=HISTORY_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def cycles(self):
+        return [airac for (airac,) in self.db.execute("SELECT DISTINCT airac FROM cycles ORDER BY airac")]
+
+    def previous(self, airac):
+        # Latest archived cycle before `airac`
+        row = self.db.execute("SELECT MAX(airac) FROM cycles WHERE airac < ?", (airac,)).fetchone()
+        return row[0]
+
+    def archive(self, airac, tables=TABLES, rows_for=cycle_rows):
+        # Add (or replace) a cycle from its processed rows; returns {table: (rows, new records)}
+        counts = {}
+        with self.db:
+            for table in tables:
+                known = dict(self.db.execute("SELECT hash, id FROM records WHERE tbl = ?", (table,)))
+                ids, new = [], []
+                for row in rows_for(airac, table):
+                    values = [value(field, row.get(field)) for field in FIELDS[table]]
+                    text = json.dumps([table, values], separators=(",", ":"))
+                    digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+                    if digest not in known:
+                        cursor = self.db.execute(
+                            "INSERT INTO records (tbl, hash, key, data) VALUES (?, ?, ?, ?)",
+                            (table, digest, record_key(table, row), encode_record(values)),
+                        )
+                        known[digest] = cursor.lastrowid
+                        new.append(digest)
+                    ids.append(known[digest])
+
+                self.db.execute(
+                    "INSERT OR REPLACE INTO cycles (airac, tbl, rows, ids, archived) VALUES (?, ?, ?, ?, ?)",
+                    (airac, table, len(ids), encode_ids(ids), datetime.now(UTC).isoformat()),
+                )
+                counts[table] = (len(ids), len(new))
+        return counts
+
+    def ids(self, airac, table):
+        row = self.db.execute("SELECT ids FROM cycles WHERE airac = ? AND tbl = ?", (airac, table)).fetchone()
+        if row is None:
+            raise KeyError(f"AIRAC {airac} has no {table} table in the history store")
+        return decode_ids(row[0])
+
+    def records(self, table, ids):
+        # {id: (key, row)} for the given record ids
+        found = {}
+        ids = list(ids)
+        for start in range(0, len(ids), 900):
+            chunk = ids[start:start + 900]
+            query = f"SELECT id, key, data FROM records WHERE id IN ({','.join('?' * len(chunk))})"
+            for record_id, key, data in self.db.execute(query, chunk):
+                found[record_id] = (key, decode_record(table, data))
+        return found
+
+    def rows(self, airac, table):
+        # A cycle's rows, in the order they were archived
+        ids = self.ids(airac, table)
+        records = self.records(table, set(ids))
+        for record_id in ids:
+            yield dict(records[record_id][1])
+
+    def diff(self, old, new, tables=TABLES):
+        # Added, removed and changed records between two cycles, per table
+        report = {"from": old, "to": new, "tables": {}}
+        for table in tables:
+            old_ids, new_ids = set(self.ids(old, table)), set(self.ids(new, table))
+            removed = self.records(table, old_ids - new_ids)
+            added = self.records(table, new_ids - old_ids)
+            report["tables"][table] = table_changes(table, removed, added)
+        return report
+
+
+def table_changes(table, removed, added):
+    if table == "route":
+        # Routes have no key, a changed route is a removed one and an added one
+        changes = {
+            "added": sorted(route_text(row) for _, row in added.values()),
+            "removed": sorted(route_text(row) for _, row in removed.values()),
+        }
+        return {**{f"{kind}_count": len(items) for kind, items in changes.items()}, **limit(changes)}
+
+    old = {key: row for key, row in removed.values()}
+    new = {key: row for key, row in added.values()}
+    changes = {
+        "added": sorted(k for k in new if k not in old),
+        "removed": sorted(k for k in old if k not in new),
+        "changed": [],
+    }
+    if "lat" in FIELDS[table]:
+        changes["moved"] = []
+
+    for key in sorted(k for k in new if k in old):
+        fields = {field: [old[key][field], new[key][field]] for field in FIELDS[table]
+                  if old[key][field] != new[key][field]}
+        if "moved" in changes and ("lat" in fields or "lon" in fields):
+            distance = haversine_nm(old[key]["lat"], old[key]["lon"], [new[key]["lat"]], [new[key]["lon"]])[0]
+            changes["moved"].append({"key": key, "from": [old[key]["lat"], old[key]["lon"]],
+                                     "to": [new[key]["lat"], new[key]["lon"]], "nm": round(float(distance), 3)})
+            fields = {field: values for field, values in fields.items() if field not in ("lat", "lon", "geohash")}
+        if fields:
+            changes["changed"].append({"key": key, "fields": fields})
+
+    return {**{f"{kind}_count": len(items) for kind, items in changes.items()}, **limit(changes)}
+
+
+def route_text(row):
+    qualifiers = [row[field] for field in ("aircraft", "direction", "altitude") if row.get(field)]
+    return " ".join([row["dep"], row["route"] or "", row["dest"]]) + (f" ({', '.join(qualifiers)})" if qualifiers else "")
+
+
+def limit(changes):
+    if not CHANGE_EXAMPLES:
+        return changes
+    return {kind: items[:CHANGE_EXAMPLES] for kind, items in changes.items()}
+
+
+def summarize(report):
+    lines = [f"Changes from AIRAC {report['from']} to {report['to']}:"]
+    for table, changes in report["tables"].items():
+        counts = ", ".join(f"{changes[kind]} {kind.removesuffix('_count')}" for kind in changes if kind.endswith("_count"))
+        lines.append(f"  {table:<8} {counts}")
+    return "\n".join(lines)
+
+
+def write_change_report(report, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(summarize(report))
+    print(f"Change report written to {path}")
+
+
+def change_report_path(airac):
+    return f"data/{airac}/changes.json"
+
+
+def archive_cycle(airac, path=HISTORY_PATH):
+    # Archive a processed cycle and write its changes against the previous archived one
+    with HistoryStore(path) as history:
+        counts = history.archive(airac)
+        print(f"Archived AIRAC {airac}: " + ", ".join(f"{t} {rows} rows ({new} new)" for t, (rows, new) in counts.items()))
+        previous = history.previous(airac)
+        if previous:
+            write_change_report(history.diff(previous, airac), change_report_path(airac))
+    return counts
@@ -1,126 +1,134 @@
-import csv
-import json
-from star import parse_star
-from sid import parse_sid
-from airac import ensure_current_airac, calculate_current_airac
-import shutil
-from utils import csv_to_json
-from db import update
-import asyncio
-
-airac = calculate_current_airac()[0]
-ensure_current_airac()
-
-# fix
-
-# Fields to include in the JSON
-fix_fields = [
-    "FIX_ID",
-    "LAT_DECIMAL",
-    "LONG_DECIMAL",
-]
-
-
-fix_csv = f"data/{airac}/csv/FIX_BASE.csv"
-fix_json = f"data/{airac}/json/fixes.json"
-
-csv_to_json(fix_csv, fix_json, fix_fields)
-
-# nav
-
-src = f"data/{airac}/csv/NAV_BASE.csv"
-dst = f"data/{airac}/csv/NAV_BASE_UTF8.csv"
-
-with open(src, encoding="latin-1") as f:
-    text = f.read()
-
-with open(dst, "w", encoding="utf-8", newline="") as f:
-    f.write(text)
-
-print("Converted to UTF-8:", dst)
-
-nav_fields = [
-    "NAV_ID",
-    "LAT_DECIMAL",
-    "LONG_DECIMAL",
-    "NAME"
-]
-
-nav_csv = f"data/{airac}/csv/NAV_BASE_UTF8.csv"
-nav_json = f"data/{airac}/json/nav.json"
-
-csv_to_json(nav_csv, nav_json, nav_fields)
-
-# awy
-
-awy_csv = f"data/{airac}/csv/AWY_BASE.csv"
-awy_json = f"data/{airac}/json/awy.json"
-
-awy_fields = [
-    "AWY_ID",
-    "AIRWAY_STRING",
-]
-
-csv_to_json(awy_csv, awy_json, awy_fields)
-
-# apt
-
-apt_csv = f"data/{airac}/csv/APT_BASE.csv"
-apt_json = f"data/{airac}/json/apt.json"
-
-# Fields to include in the JSON
-apt_fields = [
-    "ARPT_ID",
-    "LAT_DECIMAL",
-    "LONG_DECIMAL",
-]
-
-csv_to_json(apt_csv, apt_json, apt_fields)
-
-
-###
-
-parse_sid(f"data/{airac}/csv/DP_BASE.csv", f"data/{airac}/csv/DP_RTE.csv", f"data/{airac}/csv/sid.csv")
-parse_star(f"data/{airac}/csv/STAR_BASE.csv", f"data/{airac}/csv/STAR_RTE.csv", f"data/{airac}/csv/star.csv")
-
-sids_csv = f"data/{airac}/csv/sid.csv"
-sids_json = f"data/{airac}/json/sid.json"
-
-stars_csv = f"data/{airac}/csv/star.csv"
-stars_json = f"data/{airac}/json/star.json"
-
-# Fields to include in the JSON
-sid_fields = [
-    "sid_name",
-    "served_arpt",
-    "fixes",
-]
-
-star_fields = [
-    "star_name",
-    "served_arpt",
-    "fixes",
-]
-
-csv_to_json(sids_csv, sids_json, sid_fields)
-csv_to_json(stars_csv, stars_json, star_fields)
-
-
-# FAA routes
-
-# NOTE - ALWAYS REMOVE BOM ON FILES DOWNLOADED FROM FAA PREFROUTES SITE
-
-faa_csv = f"data/{airac}/csv/faa.csv"
-faa_json = f"data/{airac}/json/faa.json"
-
-faa_fields = [
-    "Orig",
-    "Route String",
-    "Dest",
-    "Aircraft",
-    "Direction"
-]
-
-csv_to_json(faa_csv, faa_json, faa_fields)
-
-asyncio.run(update(airac))
\ No newline at end of file
+import argparse, sys
+import pipeline
+from validate import ValidationError, failure_summary
+
+# Command line entry point. Everything runs through pipeline.run_pipeline, so
+# the same stages can be run from another process without this script:
+#
+#   python main.py                          # download, parse and load the current cycle
+#   python main.py load --airac 2603 --tables route fix
+#   python main.py run --outputs sqlite parquet     # local files only, no database
+#   python main.py parse --dry-run
+#   python main.py validate                 # write data/<airac>/validation.json
+#   python main.py verify
+#   python main.py benchmark --scale 1 5
+#   python main.py history diff 2601 2603   # what changed between two archived cycles
+#   python main.py daemon                   # prefetch, stage and swap cycles on schedule
+#
+# Flags go before or after the subcommand. Defaults still come from the environment
+# (see the CONFIG block in pipeline.py).
+
+COMMANDS = {
+    "run": (pipeline.DEFAULT_STAGES, "download, parse, validate and load (the default)"),
+    "download": (("download",), "download and extract the cycle's NASR CSVs and preferred routes"),
+    "parse": (("parse",), "write the snapshot and debug JSON"),
+    "validate": (("validate",), "check that every route and procedure token resolves, without loading"),
+    "load": (("load",), "load the tables whose inputs changed into the database"),
+    "verify": (("verify",), "compare the database's row counts with the cycle's files"),
+}
+
+
+def common_options(suppress=False):
+    # The subcommands take the same options as the root parser, but with no
+    # defaults of their own: argparse would otherwise overwrite options given
+    # before the subcommand (main.py --airac 2603 load) with the subparser's
+    def default(value):
+        return argparse.SUPPRESS if suppress else value
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--airac", default=default(None),
+                        help="cycle to work on, e.g. 2603 (default: the current one)")
+    common.add_argument("--tables", nargs="+", choices=pipeline.TABLES, default=default(None), help="only these tables")
+    common.add_argument("--dry-run", action="store_true", default=default(False),
+                        help="show what would run without doing it")
+    common.add_argument("--force", action="store_true", default=default(pipeline.FORCE),
+                        help="redo stages even if their inputs haven't changed")
+    common.add_argument("--workers", type=int, default=default(pipeline.WORKERS), help="parse processes")
+    common.add_argument("--outputs", nargs="+", choices=pipeline.OUTPUT_CHOICES, default=default(pipeline.OUTPUTS),
+                        help="where to load the tables (default: postgres)")
+    common.add_argument("--memory-budget", type=int, default=default(pipeline.MEMORY_BUDGET_MB), metavar="MB",
+                        help="stream everything in one process to stay within this peak RSS")
+    return common
+
+
+def parser():
+    root = argparse.ArgumentParser(description="Update the nav database from the FAA's NASR subscription.",
+                                   parents=[common_options()])
+    commands = root.add_subparsers(dest="command")
+    for name, (_, help) in COMMANDS.items():
+        commands.add_parser(name, parents=[common_options(suppress=True)], help=help)
+
+    daemon = commands.add_parser("daemon", help="keep running: prefetch and stage each cycle, swap it in at 0901Z")
+    daemon.add_argument("--workers", type=int, default=argparse.SUPPRESS, help="parse processes")
+
+    history = commands.add_parser("history", help="archived cycles and what changed between them")
+    actions = history.add_subparsers(dest="action", required=True)
+    actions.add_parser("list", help="list the archived cycles")
+    archive = actions.add_parser("archive", help="archive a parsed cycle (the current one by default)")
+    archive.add_argument("--airac", default=argparse.SUPPRESS, help="cycle to archive, e.g. 2603")
+    changes = actions.add_parser("diff", help="write a change report between two archived cycles")
+    changes.add_argument("old", help="earlier cycle, e.g. 2601")
+    changes.add_argument("new", help="later cycle, e.g. 2603")
+    changes.add_argument("--tables", nargs="+", choices=pipeline.TABLES, default=pipeline.TABLES, help="only these tables")
+    changes.add_argument("--output", help="report path (default: data/<new>/changes-<old>.json)")
+
+    benchmark = commands.add_parser("benchmark", help="benchmark the pipeline on synthetic data")
+    benchmark.add_argument("--scale", type=int, nargs="+", default=[1], help="multiples of NASR size (e.g. 1 5 20)")
+    benchmark.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    return root
+
+
+def history(args):
+    from history import HistoryStore, archive_cycle, write_change_report
+    from airac import calculate_current_airac
+
+    if args.action == "archive":
+        archive_cycle(args.airac or calculate_current_airac()[0])
+        return 0
+
+    with HistoryStore() as store:
+        if args.action == "list":
+            print("\n".join(store.cycles()) or "No cycles archived yet")
+            return 0
+        report = store.diff(args.old, args.new, args.tables)
+    write_change_report(report, args.output or f"data/{args.new}/changes-{args.old}.json")
+    return 0
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+
+    if args.command == "benchmark":
+        import benchmark
+        return benchmark.main(["--scale", *map(str, args.scale)] + (["--update-baseline"] if args.update_baseline else []))
+
+    if args.command == "history":
+        return history(args)
+
+    if args.command == "daemon":
+        import daemon
+        daemon.run(args.workers)
+        return 0
+
+    stages, _ = COMMANDS[args.command or "run"]
+    try:
+        summary = pipeline.run_pipeline(
+            airac=args.airac,
+            stages=stages,
+            targets=args.tables,
+            dry_run=args.dry_run,
+            force=args.force,
+            workers=args.workers,
+            memory_budget=args.memory_budget,
+            outputs=args.outputs,
+        )
+    except ValidationError as e:
+        print(f"{e}, nothing was loaded:\n{failure_summary(e.report)}", file=sys.stderr)
+        print(f"See {e.path} for details, or raise VALIDATION_THRESHOLD to load anyway", file=sys.stderr)
+        return 1
+    return 0 if summary.get("ok", True) else 1
+
+
+# Worker processes import this module, so only run when it is the script
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import contextvars, cProfile, json, os, sys, time, tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, UTC
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Per-stage instrumentation for a pipeline run. Each stage records wall and
+# CPU time, the process's peak RSS when it finished, and rows/bytes in and
+# out. Code running inside a stage adds to its counters with add()/count(),
+# which look the stage up through a context variable, so tables loading
+# concurrently in their own asyncio tasks each count into their own stage.
+# CPU time is per process, so concurrent stages overlap.
+#
+# The run report is written as JSON and, with METRICS_TEXTFILE set, as a
+# Prometheus textfile for node_exporter's textfile collector.
+
+# ---- CONFIG ----
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")  # e.g. /var/lib/node_exporter/navdata.prom
+# Stages to run under cProfile ("all" or comma-separated names like parse:sid,snapshot)
+PROFILE = {name for name in os.getenv("PROFILE", "").split(",") if name}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Track Python allocations per stage with tracemalloc (slow)
+TRACEMALLOC = os.getenv("TRACEMALLOC", "0") == "1"
+# ----------------
+
+COUNTERS = ("rows_in", "rows_out", "bytes_read", "bytes_written")
+
+STAGES = []
+STARTED = datetime.now(UTC)
+_START = time.perf_counter()
+_current = contextvars.ContextVar("stage", default=None)
+_profiling = False
+
+
+class Stage:
+    def __init__(self, name, **counts):
+        self.name = name
+        self.wall = None
+        self.cpu = None
+        self.peak_rss_mb = None
+        self.alloc_peak_mb = None
+        self.error = None
+        for counter in COUNTERS:
+            setattr(self, counter, counts.get(counter, 0))
+
+    def add(self, **counts):
+        for counter, value in counts.items():
+            setattr(self, counter, getattr(self, counter) + value)
+
+    @classmethod
+    def from_dict(cls, data):
+        stage = cls(data["stage"], **{counter: data[counter] for counter in COUNTERS})
+        stage.wall, stage.cpu = data["wall_seconds"], data["cpu_seconds"]
+        stage.peak_rss_mb, stage.alloc_peak_mb = data["peak_rss_mb"], data["alloc_peak_mb"]
+        stage.error = data["error"]
+        return stage
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "wall_seconds": self.wall,
+            "cpu_seconds": self.cpu,
+            "peak_rss_mb": self.peak_rss_mb,
+            "alloc_peak_mb": self.alloc_peak_mb,
+            **{counter: getattr(self, counter) for counter in COUNTERS},
+            "error": self.error,
+        }
+
+
+def peak_rss_mb(children=False):
+    # children=True: the largest of the (finished) worker processes
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def file_bytes(paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def should_profile(name):
+    return "all" in PROFILE or name in PROFILE
+
+
+@contextmanager
+def stage(name, **counts):
+    # with metrics.stage("parse:sid", bytes_read=...) as s: ...; s.rows_out = len(rows)
+    global _profiling
+    current = Stage(name, **counts)
+    STAGES.append(current)
+    token = _current.set(current)
+
+    # Only one profiler can be active per process; nested or concurrent
+    # stages that asked for one are skipped
+    profiler = None
+    if should_profile(name) and not _profiling:
+        _profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if TRACEMALLOC:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.wall = round(time.perf_counter() - wall, 4)
+        current.cpu = round(time.process_time() - cpu, 4)
+        current.peak_rss_mb = peak_rss_mb()
+        if TRACEMALLOC:
+            current.alloc_peak_mb = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        if profiler:
+            profiler.disable()
+            _profiling = False
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name.replace(':', '_')}.prof"))
+        _current.reset(token)
+
+
+def reset():
+    # Start a new run report, e.g. for the next run in a long-lived process
+    global STARTED, _START
+    STAGES.clear()
+    STARTED = datetime.now(UTC)
+    _START = time.perf_counter()
+
+
+def record(stages):
+    # Add stages that ran in another process (as as_dict() results); their
+    # peak RSS is that process's
+    STAGES.extend(Stage.from_dict(stage) for stage in stages)
+
+
+def add(**counts):
+    # Add to the counters of the stage this code is running in, if any
+    current = _current.get()
+    if current:
+        current.add(**counts)
+
+
+def count(rows, counter="rows_in"):
+    # Pass rows through, adding them to the current stage's counter as they're consumed
+    current = _current.get()
+    if current is None:
+        yield from rows
+        return
+    n = 0
+    try:
+        for row in rows:
+            n += 1
+            yield row
+    finally:
+        current.add(**{counter: n})
+
+
+def report(**info):
+    return {
+        "started": STARTED.isoformat(),
+        "wall_seconds": round(time.perf_counter() - _START, 4),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_workers_mb": peak_rss_mb(children=True),
+        **info,
+        "stages": [stage.as_dict() for stage in STAGES],
+    }
+
+
+def prometheus(data):
+    labels = ",".join(f'{key}="{value}"' for key, value in data.items() if key == "airac")
+    lines = []
+
+    def metric(name, help, samples):
+        lines.append(f"# HELP navdata_{name} {help}")
+        lines.append(f"# TYPE navdata_{name} gauge")
+        for sample_labels, value in samples:
+            if value is not None:
+                lines.append(f"navdata_{name}{{{sample_labels}}} {value}")
+
+    metric("run_wall_seconds", "Wall time of the whole run.", [(labels, data["wall_seconds"])])
+    metric("run_peak_rss_megabytes", "Peak resident set size of the run.", [(labels, data["peak_rss_mb"])])
+    metric("run_peak_rss_workers_megabytes", "Peak resident set size of the largest worker process.",
+           [(labels, data["peak_rss_workers_mb"])])
+    metric("run_timestamp_seconds", "When the run started.", [(labels, STARTED.timestamp())])
+
+    def stage_labels(stage):
+        return ",".join(filter(None, [labels, f'stage="{stage["stage"]}"']))
+
+    for key, name, help in (
+        ("wall_seconds", "stage_wall_seconds", "Wall time per stage."),
+        ("cpu_seconds", "stage_cpu_seconds", "Process CPU time per stage."),
+        ("peak_rss_mb", "stage_peak_rss_megabytes", "Peak RSS of the process at the end of the stage."),
+        ("alloc_peak_mb", "stage_alloc_peak_megabytes", "Peak traced Python allocations per stage."),
+        ("rows_in", "stage_rows_in", "Rows read per stage."),
+        ("rows_out", "stage_rows_out", "Rows written per stage."),
+        ("bytes_read", "stage_bytes_read", "Bytes read per stage."),
+        ("bytes_written", "stage_bytes_written", "Bytes written per stage."),
+    ):
+        metric(name, help, [(stage_labels(stage), stage[key]) for stage in data["stages"]])
+
+    metric("stage_failed", "1 if the stage raised.",
+           [(stage_labels(stage), int(stage["error"] is not None)) for stage in data["stages"]])
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path, text):
+    # node_exporter may read the file at any time, so never leave it half-written
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_report(path, textfile=METRICS_TEXTFILE, **info):
+    # JSON run report at path, plus the Prometheus textfile when configured
+    data = report(**info)
+    write_atomic(path, json.dumps(data, indent=2))
+    if textfile:
+        write_atomic(textfile, prometheus(data))
+
+    for stage in data["stages"]:
+        print(f"  {stage['stage']:<16} {stage['wall_seconds']:8.2f}s wall {stage['cpu_seconds']:8.2f}s cpu"
+              f"  in {stage['rows_in']:>8} out {stage['rows_out']:>8}")
+    print(f"Peak RSS {data['peak_rss_mb']} MB (largest worker {data['peak_rss_workers_mb'] or 0} MB)")
+    budget = info.get("memory_budget_mb")
+    if budget and max(data["peak_rss_mb"] or 0, data["peak_rss_workers_mb"] or 0) > budget:
+        print(f"Warning: peak RSS is over the {budget} MB memory budget")
+    print(f"Run report written to {path}")
+    return data
@@ -0,0 +1,72 @@
+import os, time
+from decimal import Decimal
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import asyncpg
+import metrics
+from schema import model_for, insert_fields
+
+# COPY ... FROM STDIN ingest over DIRECT_URL. Rows are streamed to Postgres
+# with asyncpg's binary COPY instead of going through the Prisma query engine;
+# column names and types come from schema.prisma.
+
+# Query parameters only the Prisma engine understands
+PRISMA_PARAMS = {"pgbouncer", "schema", "connection_limit", "pool_timeout", "socket_timeout", "statement_cache_size"}
+
+
+def asyncpg_url(url: str):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k not in PRISMA_PARAMS]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def server_settings(url: str):
+    # Prisma's ?schema= becomes the session's search_path, so COPY writes to
+    # the same schema as the Prisma client
+    schema = dict(parse_qsl(urlsplit(url).query)).get("schema")
+    return {"search_path": schema} if schema else {}
+
+
+async def create_pool(concurrency: int):
+    # COPY needs a session, so this always goes straight to Postgres, not through pgbouncer
+    url = os.getenv("DIRECT_URL") or os.getenv("DATABASE_URL")
+    return await asyncpg.create_pool(asyncpg_url(url), min_size=1, max_size=concurrency,
+                                     server_settings=server_settings(url))
+
+
+def to_value(field, value):
+    if value is None:
+        return None
+    if field.type == "Decimal":
+        return Decimal(str(value)) if value != "" else None
+    if field.type == "Int":
+        return [int(v) for v in value] if field.is_list else int(value)
+    if field.is_list:
+        return list(value)
+    return value
+
+
+def records(fields, rows):
+    for row in rows:
+        yield tuple(to_value(field, row.get(field.name)) for field in fields)
+
+
+async def copy_rows(pool, table: str, rows, target: str = None):
+    # Stream rows into `target` (the model's own table by default) and return the row count
+    model = model_for(table)
+    fields = insert_fields(model)
+    target = target or model.name
+
+    start = time.perf_counter()
+    async with pool.acquire() as conn:
+        status = await conn.copy_records_to_table(
+            target,
+            records=records(fields, rows),
+            columns=[field.name for field in fields],
+        )
+    count = int(status.split()[-1])
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0
+    print(f"{target}: copied {count} rows in {elapsed:.2f}s ({rate:.0f} rows/s)")
+    metrics.add(rows_out=count)
+    return count
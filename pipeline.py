@@ -0,0 +1,356 @@
+import asyncio, os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+import metrics
+from airac import airac_effective_date, calculate_current_airac, download_and_extract_airac
+from cache import Manifest
+from datasets import DATASETS, csv_path, json_path, dataset_sources, source_path
+from expand import expansion_tables
+from history import archive_cycle
+from procedure import PROCEDURES
+from records import CompactRows, TABLE_DATASETS, table_rows, table_sources
+from sid import parse_sid
+from sinks import SINKS, close_sinks, export, open_sinks
+from snapshot import Snapshot, is_current, snapshot_path, write_snapshot
+from star import parse_star
+from utils import csv_to_json, write_json
+from validate import validate_cycle
+
+# DAG runner for the parse side of a cycle. Each task names the tasks it
+# needs; once those are done it runs in a process pool with their results as
+# `inputs`. Parsing the datasets and building each table's rows don't depend
+# on each other, so they spread over the cores, and only the snapshot and
+# the validation before the load (which need every table) wait for all of
+# them. Results are keyed by task name, so the output doesn't depend on which
+# worker finishes first.
+#
+# With a memory budget (MEMORY_BUDGET_MB) everything runs in this process and
+# no table is held in memory: the snapshot is written straight from the CSVs
+# (routes are expanded as they're written), validation reads it back through
+# mmap, procedures are grouped on disk and tables are loaded one at a time.
+
+# ---- CONFIG ----
+# Defaults for run_pipeline, so `python main.py` can still be configured from the environment
+WORKERS = int(os.getenv("PIPELINE_WORKERS", str(os.cpu_count() or 1)))  # 1 runs everything in this process
+# JSON files are only a debug output now; the loader streams from the CSVs
+WRITE_JSON = os.getenv("WRITE_JSON", "0") == "1"
+# "db" or "snapshot" applies only what changed since the last cycle, unset reloads everything
+DIFF = os.getenv("DIFF") or None
+# Load into shadow tables and swap them in at once, keeping the previous cycle for rollback
+STAGING = os.getenv("STAGING", "0") == "1"
+# Bulk-load with COPY over DIRECT_URL instead of Prisma's create_many
+COPY = os.getenv("COPY", "0") == "1"
+# Write the compact columnar snapshot (data/<airac>/navdata.snap) of the processed cycle
+WRITE_SNAPSHOT = os.getenv("WRITE_SNAPSHOT", "1") == "1"
+# Keep every parsed cycle in the history store (data/history.sqlite) and write its change report
+HISTORY = os.getenv("HISTORY", "1") == "1"
+# Where the load stage writes: postgres (the Prisma schema, via db.update), sqlite and/or parquet
+# (data/<airac>/navdata.sqlite and data/<airac>/parquet/, see sinks.py), e.g. OUTPUTS=postgres,sqlite
+OUTPUTS = [name.strip() for name in os.getenv("OUTPUTS", "postgres").split(",") if name.strip()]
+# Peak RSS to stay under in MB, e.g. 256 in a small container; 0 is no budget
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "0"))
+# Redo every stage even if its inputs haven't changed since the last run
+FORCE = os.getenv("FORCE", "0") == "1"
+# ----------------
+
+STAGES = ("download", "parse", "validate", "load", "verify")
+DEFAULT_STAGES = ("download", "parse", "validate", "load")
+TABLES = list(TABLE_DATASETS)  # db.TABLES, without importing the Prisma client here
+OUTPUT_CHOICES = ["postgres", *SINKS]
+
+# local tasks run in this process, e.g. ones whose inputs are too big to send to a worker
+Task = namedtuple("Task", ["name", "func", "args", "deps", "local"], defaults=[(), (), False])
+
+PARSERS = {"sid": parse_sid, "star": parse_star}
+
+
+def parse_task(airac, kind, spill, inputs):
+    spec = PROCEDURES[kind]
+    return PARSERS[kind](source_path(airac, spec["base"]), source_path(airac, spec["route"]), spill=spill)
+
+
+def parsed_inputs(inputs):
+    # {"parse:sid": rows, "table:fix": rows} -> {"sid": rows, "table:fix": rows}, as records.py takes them
+    return {name.split(":", 1)[1] if name.startswith("parse:") else name: result for name, result in inputs.items()}
+
+
+def table_task(airac, table, inputs):
+    with metrics.stage(f"table:{table}", bytes_read=metrics.file_bytes(table_sources(airac, table))) as stage:
+        rows = CompactRows(table_rows(airac, table, True, parsed_inputs(inputs)))
+        stage.rows_out = len(rows)
+    return rows
+
+
+def json_task(airac, name, inputs):
+    with metrics.stage(f"json:{name}", bytes_read=metrics.file_bytes(dataset_sources(airac, name))) as stage:
+        parsed = parsed_inputs(inputs)
+        if name in parsed:
+            write_json(parsed[name], json_path(airac, name))
+        else:
+            csv_to_json(csv_path(airac, name), json_path(airac, name), DATASETS[name]["fields"])
+        stage.bytes_written = metrics.file_bytes([json_path(airac, name)])
+
+
+def snapshot_task(airac, tables, inputs):
+    sources = [path for table in tables for path in table_sources(airac, table)]
+    with metrics.stage("snapshot", bytes_read=metrics.file_bytes(sources)) as stage:
+        snapshot_tables = {table: inputs[f"table:{table}"] for table in tables}
+        expanded, expanded_kinds = expansion_tables(snapshot_tables)
+        write_snapshot(snapshot_path(airac), {**snapshot_tables, **expanded}, expanded_kinds)
+        stage.rows_out = sum(len(rows) for rows in (*snapshot_tables.values(), *expanded.values()))
+        stage.bytes_written = metrics.file_bytes([snapshot_path(airac)])
+
+
+def streamed_snapshot_task(airac, tables, inputs):
+    # Low-memory snapshot: every table is streamed from the CSVs into the
+    # writer, and the routes are expanded as it consumes them. The graph's
+    # tables are read a second time for that instead of being kept.
+    sources = [path for table in tables for path in table_sources(airac, table)]
+    with metrics.stage("snapshot", bytes_read=metrics.file_bytes(sources)) as stage:
+        parsed = parsed_inputs(inputs)
+        expanded, expanded_kinds = expansion_tables({table: table_rows(airac, table, True, parsed) for table in tables},
+                                                    lazy=True)
+        snapshot_tables = {table: table_rows(airac, table, True, parsed) for table in tables}
+        write_snapshot(snapshot_path(airac), {**snapshot_tables, **expanded}, expanded_kinds)
+        with Snapshot(snapshot_path(airac)) as snapshot:
+            stage.rows_out = sum(len(snapshot.table(name)) for name in snapshot.tables)
+        stage.bytes_written = metrics.file_bytes([snapshot_path(airac)])
+
+
+def validate_task(airac, tables, inputs):
+    if all(f"table:{table}" in inputs for table in tables):
+        return validate_cycle(airac, {table: inputs[f"table:{table}"] for table in tables})
+    # Low-memory mode reads the tables back from the snapshot instead
+    with Snapshot(snapshot_path(airac)) as snapshot:
+        return validate_cycle(airac, {table: snapshot.table(table) for table in tables})
+
+
+def cycle_tasks(airac, tables=(), json=(), snapshot=False, all_tables=tuple(TABLES), validate=False,
+                low_memory=False):
+    # Tasks for a cycle: rows for `tables` (plus every table when writing the
+    # snapshot or validating), debug JSON for the `json` datasets and
+    # optionally the snapshot and the validation. low_memory streams the
+    # snapshot instead and validates from it (so it needs snapshot=True or a
+    # current snapshot)
+    tables = list(all_tables) if snapshot or validate else list(tables)
+    if low_memory:
+        # SIDs/STARs are small once parsed, so they're parsed once (grouped on disk) and passed on
+        parse = [kind for kind in PROCEDURES if kind in json or any(kind in TABLE_DATASETS[t] for t in tables)]
+        tasks = [Task(f"parse:{kind}", parse_task, (airac, kind, True)) for kind in parse]
+        tasks += [Task(f"json:{name}", json_task, (airac, name), (f"parse:{name}",) if name in parse else ())
+                  for name in json]
+        if snapshot:
+            tasks.append(Task("snapshot", streamed_snapshot_task, (airac, tables), tuple(f"parse:{k}" for k in parse)))
+        if validate:
+            tasks.append(Task("validate", validate_task, (airac, tables), ("snapshot",) if snapshot else ()))
+        return tasks
+
+    # SIDs/STARs are parsed once up front only when their JSON needs them too
+    parse = [kind for kind in PROCEDURES if kind in json]
+
+    tasks = [Task(f"parse:{kind}", parse_task, (airac, kind, False)) for kind in parse]
+    for table in tables:
+        deps = tuple(f"parse:{name}" for name in TABLE_DATASETS[table] if name in parse)
+        tasks.append(Task(f"table:{table}", table_task, (airac, table), deps))
+    for name in json:
+        deps = (f"parse:{name}",) if name in parse else ()
+        tasks.append(Task(f"json:{name}", json_task, (airac, name), deps))
+    if snapshot:
+        tasks.append(Task("snapshot", snapshot_task, (airac, tables), tuple(f"table:{t}" for t in tables), True))
+    if validate:
+        tasks.append(Task("validate", validate_task, (airac, tables), tuple(f"table:{t}" for t in tables), True))
+    return tasks
+
+
+def run_task(func, args, inputs):
+    # Worker side: run the task and send its metrics back with the result
+    metrics.STAGES.clear()
+    result = func(*args, inputs)
+    return result, [stage.as_dict() for stage in metrics.STAGES]
+
+
+def run(tasks, workers=WORKERS):
+    # {task name: result}; with workers=1 tasks run one after another in this process
+    pending = {task.name: task for task in tasks}
+    for task in tasks:
+        missing = [dep for dep in task.deps if dep not in pending]
+        if missing:
+            raise ValueError(f"{task.name} depends on unknown tasks: {', '.join(missing)}")
+
+    results = {}
+    running = {}  # future -> task name
+
+    with ProcessPoolExecutor(workers) if workers > 1 else nullcontext() as pool:
+        try:
+            while pending or running:
+                # Sorted, so tasks start in the same order every run
+                ready = sorted(name for name, task in pending.items() if all(dep in results for dep in task.deps))
+                for name in ready:
+                    task = pending.pop(name)
+                    inputs = {dep: results[dep] for dep in task.deps}
+                    if pool is None or task.local:
+                        results[name] = task.func(*task.args, inputs)
+                    else:
+                        running[pool.submit(run_task, task.func, task.args, inputs)] = name
+
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        results[name], stages = future.result()
+                        metrics.record(stages)
+                elif pending and not ready:
+                    raise ValueError(f"Dependency cycle between {', '.join(sorted(pending))}")
+        except BaseException:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+            raise
+
+    return results
+
+
+def parsed_results(results):
+    # Results in the form records.table_rows and db.update take as `parsed`
+    return parsed_inputs({name: result for name, result in results.items()
+                          if name.startswith(("parse:", "table:"))})
+
+
+def run_pipeline(airac=None, stages=DEFAULT_STAGES, targets=None, dry_run=False, force=FORCE, workers=WORKERS,
+                 write_json=WRITE_JSON, snapshot=WRITE_SNAPSHOT, history=HISTORY, diff=DIFF, staging=STAGING, copy=COPY,
+                 swap=True, memory_budget=MEMORY_BUDGET_MB, outputs=OUTPUTS):
+    # Run some or all of download/parse/validate/load/verify for one cycle (the
+    # current one by default). targets limits the work to some tables; dry_run
+    # only prints what would run. A cycle that fails validation raises
+    # validate.ValidationError before anything is loaded. Stages whose inputs haven't changed since they
+    # last ran are skipped (see cache.py) unless force is set. staging with
+    # swap=False leaves the tables staged for db.swap_staged. memory_budget
+    # (MB) switches to the low-memory mode described above. outputs picks
+    # what the load stage writes (see OUTPUTS). Returns a summary.
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(unknown)} (expected {', '.join(STAGES)})")
+    tables = list(targets) if targets else list(TABLES)
+    unknown = [table for table in tables if table not in TABLES]
+    if unknown:
+        raise ValueError(f"Unknown tables: {', '.join(unknown)}")
+    unknown = [output for output in outputs if output not in OUTPUT_CHOICES]
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(unknown)} (expected {', '.join(OUTPUT_CHOICES)})")
+
+    airac = airac or calculate_current_airac()[0]
+    summary = {"airac": airac, "stages": list(stages), "tables": tables, "dry_run": dry_run}
+    prefix = "[dry run] " if dry_run else ""
+    metrics.reset()
+    if memory_budget:
+        workers = 1
+        print(f"{prefix}Memory budget {memory_budget} MB: one process, tables streamed")
+
+    try:
+        csv_folder = os.path.dirname(source_path(airac, "x"))
+        if "download" in stages:
+            if not dry_run:
+                download_and_extract_airac(airac, airac_effective_date(airac))
+            elif not os.path.exists(csv_folder):
+                print(f"{prefix}Would download AIRAC {airac}")
+        if not os.path.exists(csv_folder):
+            if dry_run:
+                return summary
+            raise FileNotFoundError(f"AIRAC {airac} hasn't been downloaded to {csv_folder}, run the download stage first")
+
+        manifest = Manifest(airac, force=force)
+        # File sinks are only needed (and pyarrow only checked for) when loading
+        sinks = open_sinks(airac, outputs) if "load" in stages else []
+        # Only tables whose source files changed since they were last loaded, per output
+        stale_for = {
+            sink.name: [table for table in tables
+                        if not manifest.is_current(f"{sink.name}:{table}", table_sources(airac, table), sink.outputs(table))]
+            for sink in sinks
+        }
+        if "postgres" in outputs:
+            stale_for["postgres"] = [table for table in tables
+                                     if not manifest.is_current(f"load:{table}", table_sources(airac, table))]
+        stale = [table for table in tables if any(table in stale_tables for stale_tables in stale_for.values())]
+        parsed = {}
+
+        # Validation checks the whole cycle, but only when something is about to be loaded or it was asked for alone
+        validating = "validate" in stages and (bool(stale) or "load" not in stages)
+
+        if "parse" in stages or validating:
+            names = [name for name in DATASETS if any(name in TABLE_DATASETS[table] for table in tables)]
+            json_names = [
+                name for name in names
+                if "parse" in stages and write_json and not manifest.is_current(f"json:{name}", dataset_sources(airac, name), [json_path(airac, name)])
+            ]
+            snapshot_sources = [path for table in TABLES for path in table_sources(airac, table)]
+            # Low-memory validation reads the snapshot, so it needs one. One
+            # written by an older version of snapshot.py is rebuilt
+            write_snap = ("parse" in stages and snapshot or bool(memory_budget) and validating) and \
+                not (manifest.is_current("snapshot", snapshot_sources, [snapshot_path(airac)])
+                     and is_current(snapshot_path(airac)))
+
+            tasks = cycle_tasks(airac, stale if "load" in stages else (), json_names, write_snap, validate=validating,
+                                low_memory=bool(memory_budget))
+            summary["tasks"] = [task.name for task in tasks]
+            print(f"{prefix}Parse tasks: {', '.join(summary['tasks']) or 'none, everything is up to date'}")
+
+            if not dry_run:
+                results = run(tasks, workers)
+                parsed = parsed_results(results)
+                if validating:
+                    summary["validate"] = results["validate"]
+                    summary["ok"] = results["validate"]["ok"]
+                for name in json_names:
+                    manifest.mark(f"json:{name}", dataset_sources(airac, name))
+                if write_snap:
+                    manifest.mark("snapshot", snapshot_sources)
+
+            # After the snapshot, which it reads the cycle from
+            if "parse" in stages and history and not manifest.is_current("history", snapshot_sources):
+                print(f"{prefix}Archiving AIRAC {airac} into the history store")
+                if not dry_run:
+                    with metrics.stage("history") as stage:
+                        counts = archive_cycle(airac)
+                        stage.rows_in = sum(rows for rows, _ in counts.values())
+                        stage.rows_out = sum(new for _, new in counts.values())
+                    manifest.mark("history", snapshot_sources)
+
+        # The Prisma client is only needed for the database stages
+        if "load" in stages:
+            summary["load"] = stale_for
+            for output, stale_tables in stale_for.items():
+                print(f"{prefix}Tables to load into {output}: {', '.join(stale_tables) or 'none, everything is up to date'}")
+
+            # File outputs ride along with the Postgres load where it reads the
+            # same table anyway, the rest are exported on their own
+            loading = stale_for.get("postgres", [])
+            tee = {table: [sink for sink in sinks if table in stale_for[sink.name]] for table in loading}
+            exports = {table: [sink for sink in sinks if table in stale_for[sink.name]]
+                       for table in stale if table not in loading}
+            exports = {table: table_sinks for table, table_sinks in exports.items() if table_sinks}
+
+            if not dry_run:
+                try:
+                    if loading:
+                        from db import CONCURRENCY, update
+                        asyncio.run(update(airac, stream=True, diff=diff, concurrency=1 if memory_budget else CONCURRENCY,
+                                           stage=staging, copy=copy, parsed=parsed, tables=loading, manifest=manifest,
+                                           swap=swap, sinks=tee))
+                    export(airac, exports, parsed)
+                finally:
+                    # File outputs are per cycle, so they're kept even while Postgres is only staged
+                    close_sinks(sinks, manifest, airac)
+
+        if "verify" in stages:
+            print(f"{prefix}Verifying {', '.join(tables)} against AIRAC {airac}")
+            if not dry_run:
+                from db import verify
+                with metrics.stage("verify"):
+                    results = asyncio.run(verify(airac, tables))
+                summary["verify"] = results
+                summary["ok"] = summary.get("ok", True) and all(expected == found for expected, found in results.values())
+    finally:
+        if not dry_run:
+            metrics.write_report(f"data/{airac}/run-report.json", airac=airac, memory_budget_mb=memory_budget or None)
+
+    return summary
@@ -0,0 +1,216 @@
+import csv, os, sqlite3, tempfile
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import groupby
+from utils import decoded_lines
+import metrics
+
+# One procedure parser for SIDs and STARs (and later approaches). Each kind
+# only differs in its column names, which end of the transition is cut off
+# and which end of the body the transition attaches to, so those are
+# described here and columns are read by header name.
+#
+# With spill=True the route points are grouped in a temporary SQLite file
+# (in SPILL_DIR) instead of in dicts and come back one procedure at a time,
+# so memory holds the merged bodies and the rows being built, not the file.
+
+# ---- CONFIG ----
+SPILL_DIR = os.getenv("SPILL_DIR") or None  # default: the system temp folder
+# ----------------
+
+PROCEDURES = {
+    "sid": {
+        "base": "DP_BASE.csv",
+        "route": "DP_RTE.csv",
+        "name_field": "sid_name",
+        "base_code": "DP_COMPUTER_CODE",
+        "route_code": "DP_COMPUTER_CODE",
+        # transition KAYLN3.SMUUV belongs to the first body named KAYLN3.*,
+        # and the body fixes go before the transition
+        "match": "prefix",
+    },
+    "star": {
+        "base": "STAR_BASE.csv",
+        "route": "STAR_RTE.csv",
+        "name_field": "star_name",
+        "base_code": "STAR_COMPUTER_CODE",
+        "route_code": "STAR_COMPUTER_CODE",
+        # transition BOBTA.TPGUN2 belongs to the first body named *.TPGUN2,
+        # and the body fixes go after the transition
+        "match": "suffix",
+    },
+}
+
+# Columns shared by every NASR procedure file
+SERVED_ARPT = "SERVED_ARPT"
+PORTION = "ROUTE_PORTION_TYPE"
+TRANSITION_CODE = "TRANSITION_COMPUTER_CODE"
+POINT_SEQ = "POINT_SEQ"
+POINT = "POINT"
+ARPT_RWY_ASSOC = "ARPT_RWY_ASSOC"
+
+
+def name_index(names, match):
+    # {prefix or suffix: first name with it}, so "first procedure whose name
+    # starts/ends with X" is a single dict lookup instead of a scan
+    index = {}
+    for name in names:
+        for i in range(len(name) + 1):
+            index.setdefault(name[:i] if match == "prefix" else name[i:], name)
+    return index
+
+
+def match_body(index, name, match):
+    # Derive the body name from a transition (e.g. KAYLN3.SMUUV => KAYLN3.KAYLN)
+    parts = name.split(".")
+    if len(parts) == 2:
+        return index.get(parts[0] if match == "prefix" else parts[1])
+    return None
+
+
+def load_served_airports(basefile, spec):
+    served_airports = {}  # served airport per procedure
+    seen = set()
+
+    for row in metrics.count(csv.DictReader(decoded_lines(basefile))):
+        key = (row[spec["base_code"]], row[SERVED_ARPT])
+        if key not in seen:
+            seen.add(key)
+            served_airports[key[0]] = key[1]
+
+    return served_airports
+
+
+def load_routes(routefile, spec):
+    # BODY and TRANSITION points in one pass
+    body_routes = defaultdict(list)  # {(procedure name, arpt_runway_assoc): [(point_seq, fix name)]}
+    transition_routes = defaultdict(list)  # {transition name: [(point_seq, fix name)]}
+
+    for row in metrics.count(csv.DictReader(decoded_lines(routefile))):
+        portion = row[PORTION]
+        if portion == "BODY":
+            body_routes[(row[spec["route_code"]], row[ARPT_RWY_ASSOC])].append((int(row[POINT_SEQ]), row[POINT]))
+        elif portion == "TRANSITION":
+            transition_routes[row[TRANSITION_CODE]].append((int(row[POINT_SEQ]), row[POINT]))
+
+    return body_routes, transition_routes
+
+
+@contextmanager
+def spill_routes(routefile, spec):
+    # Same groups as load_routes, from a temporary SQLite file: (bodies,
+    # transitions) as iterators of (key, [fixes]) in the order load_routes'
+    # dicts would have them, points sorted by POINT_SEQ descending
+    fd, path = tempfile.mkstemp(suffix=".sqlite", dir=SPILL_DIR)
+    os.close(fd)
+    db = sqlite3.connect(path)
+    try:
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("CREATE TABLE points (portion TEXT, name_order INTEGER, group_order INTEGER, name TEXT, "
+                   "grp TEXT, seq INTEGER, point TEXT)")
+        # Where each name and group first appears, so they come back in file
+        # order; one entry per procedure, not per point
+        orders = {}
+
+        def point(row):
+            body = row[PORTION] == "BODY"
+            name = row[spec["route_code"]] if body else row[TRANSITION_CODE]
+            group = row[ARPT_RWY_ASSOC] if body else ""
+            name_order = orders.setdefault((row[PORTION], name), len(orders))
+            group_order = orders.setdefault((row[PORTION], name, group), len(orders))
+            return row[PORTION], name_order, group_order, name, group, int(row[POINT_SEQ]), row[POINT]
+
+        rows = (point(row) for row in metrics.count(csv.DictReader(decoded_lines(routefile)))
+                if row[PORTION] in ("BODY", "TRANSITION"))
+        db.executemany("INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        orders.clear()
+
+        def groups(portion):
+            query = ("SELECT name, grp, point FROM points WHERE portion = ? "
+                     "ORDER BY name_order, group_order, seq DESC, rowid")
+            for (name, group), points in groupby(db.execute(query, (portion,)), key=lambda p: (p[0], p[1])):
+                # transitions are keyed by name only, like in load_routes
+                yield (name, group) if portion == "BODY" else name, [p[2] for p in points]
+
+        yield groups("BODY"), groups("TRANSITION")
+    finally:
+        db.close()
+        os.remove(path)
+
+
+def sorted_groups(routes):
+    # load_routes' dicts as (key, [fixes]) sorted by POINT_SEQ descending
+    for key, points in routes.items():
+        points.sort(key=lambda p: p[0], reverse=True)
+        yield key, [p[1] for p in points]
+
+
+def merge_bodies(body_groups):
+    # Keep the fixes common to all airport/runway groups of each body
+    grouped_output = defaultdict(list)
+    for (name, airport_group), fixes in body_groups:
+        grouped_output[name].append(fixes)
+
+    merged_body_fixes = {}  # {name: [common fixes]}
+    for name, all_fix_groups in grouped_output.items():
+        common_fixes = set(all_fix_groups[0])
+        for fixes in all_fix_groups[1:]:
+            common_fixes &= set(fixes)
+        merged_body_fixes[name] = [f for f in all_fix_groups[0] if f in common_fixes]
+
+    return merged_body_fixes
+
+
+def parse_procedures(kind, basefile, routefile, spill=False):
+    # Bodies first, then transitions merged with their body, as
+    # [{<name_field>, served_arpt, fixes}] rows
+    if spill:
+        with spill_routes(routefile, PROCEDURES[kind]) as (body_groups, transition_groups):
+            return list(procedure_rows(kind, basefile, body_groups, transition_groups))
+    body_routes, transition_routes = load_routes(routefile, PROCEDURES[kind])
+    return list(procedure_rows(kind, basefile, sorted_groups(body_routes), sorted_groups(transition_routes)))
+
+
+def procedure_rows(kind, basefile, body_groups, transition_groups):
+    spec = PROCEDURES[kind]
+    match = spec["match"]
+
+    served_airports = load_served_airports(basefile, spec)
+    merged_body_fixes = merge_bodies(body_groups)
+    index = name_index(merged_body_fixes, match)
+
+    for name, fixes in merged_body_fixes.items():
+        matched = match_body(index, name, match) or name
+        yield {
+            spec["name_field"]: name,
+            "served_arpt": served_airports.get(matched, ""),
+            "fixes": " ".join(fixes),
+        }
+
+    for name, fixes in transition_groups:
+        matched = match_body(index, name, match)
+        if matched:
+            # The shared fix appears in both, keep the body's copy
+            if match == "prefix":
+                fixes = merged_body_fixes[matched] + fixes[1:]
+            else:
+                fixes = fixes[:-1] + merged_body_fixes[matched]
+        elif len(name.split(".")) != 2:
+            # Served airport falls back to the transition's own name
+            matched = name
+
+        yield {
+            spec["name_field"]: name,
+            "served_arpt": served_airports.get(matched, ""),
+            "fixes": " ".join(fixes),
+        }
+
+
+def write_procedures(kind, rows, outfile):
+    name_field = PROCEDURES[kind]["name_field"]
+
+    with open(outfile, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=[name_field, "served_arpt", "fixes"])
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,199 @@
+import json, os
+from itertools import chain
+from datasets import DATASETS, csv_path, json_path, source_path, dataset_sources
+from procedure import PROCEDURES, parse_procedures
+import geohash
+import metrics
+from utils import iter_csv
+
+# Database rows for each table, built from the parsed datasets. Nothing here
+# touches the database, so the same rows can be loaded, diffed or exported.
+
+APT_MAPPING = {
+    "ARPT_ID": "code",
+    "LAT_DECIMAL": "lat",
+    "LONG_DECIMAL": "lon"
+}
+
+FIX_MAPPING = {
+    "FIX_ID": "fix_id",
+    "LAT_DECIMAL": "lat",
+    "LONG_DECIMAL": "lon"
+}
+
+NAV_MAPPING = {
+    "NAV_ID": "fix_id",
+    "LAT_DECIMAL": "lat",
+    "LONG_DECIMAL": "lon",
+    "NAME": "nav_name"
+}
+
+# Primary key of each table, matching the @id fields in schema.prisma
+KEYS = {
+    "airport": "code",
+    "airway": "awy_code",
+    "fix": "fix_id",
+    "sid": "sid_code",
+    "star": "star_code",
+}
+
+# Datasets feeding each table
+TABLE_DATASETS = {
+    "airport": ["apt"],
+    "airway": ["awy"],
+    "route": ["faa"],
+    "fix": ["fixes", "nav"],
+    "sid": ["sid"],
+    "star": ["star"],
+}
+
+
+def parse_dataset(airac: str, name: str):
+    kind = DATASETS[name]["procedure"]
+    spec = PROCEDURES[kind]
+    return parse_procedures(kind, source_path(airac, spec["base"]), source_path(airac, spec["route"]))
+
+
+def read_dataset(airac: str, name: str, stream: bool = False, parsed: dict = None):
+    # parsed holds datasets already in memory (e.g. {"sid": [...]}); otherwise
+    # stream=True reads straight from the source files, stream=False from the JSON debug output
+    if parsed and name in parsed:
+        return parsed[name]
+    if stream and "procedure" in DATASETS[name]:
+        return parse_dataset(airac, name)
+    if stream:
+        return iter_csv(csv_path(airac, name), DATASETS[name]["fields"])
+
+    with open(json_path(airac, name), "r", encoding="utf-8-sig") as f:
+        return json.load(f)
+
+
+def table_sources(airac: str, table: str):
+    return [path for name in TABLE_DATASETS[table] for path in dataset_sources(airac, name)]
+
+
+def has_json(airac: str, table: str):
+    return all(os.path.exists(json_path(airac, name)) for name in TABLE_DATASETS[table])
+
+
+def entity_rows(items, mapping: dict):
+    for item in items:
+        yield {db_field: item[csv_field] for csv_field, db_field in mapping.items() if csv_field in item}
+
+
+def with_geohash(rows):
+    for row in rows:
+        if row.get("lat") and row.get("lon"):
+            row["geohash"] = geohash.encode(row["lat"], row["lon"])
+        yield row
+
+
+def faa_route_rows(items):
+    for item in items:
+        yield {
+            "dep": item.get("Orig"),
+            "dest": item.get("Dest"),
+            "route": item.get("Route String"),
+            "altitude": None,
+            "notes": " ".join(filter(None, [item.get("Aircraft"), item.get("Direction")])),
+            "source": "faa",
+            # the same qualifiers as structured columns, for route_index.py and SQL filters
+            "aircraft": item.get("Aircraft") or None,
+            "direction": item.get("Direction") or None,
+            "route_type": item.get("Type") or None,
+            "dep_artcc": item.get("DCNTR") or None,
+            "dest_artcc": item.get("ACNTR") or None,
+        }
+
+
+def airway_rows(items):
+    for item in items:
+        yield {
+            "awy_code": item.get("AWY_ID"),
+            "fixes": item.get("AIRWAY_STRING", "").split(),
+        }
+
+
+def sid_rows(items):
+    for item in items:
+        yield {
+            "sid_code": item.get("sid_name"),
+            "apts": item.get("served_arpt", "").split(),
+            "fixes": item.get("fixes", "").split(),
+        }
+
+
+def star_rows(items):
+    for item in items:
+        yield {
+            "star_code": item.get("star_name"),
+            "apts": item.get("served_arpt", "").split(),
+            "fixes": item.get("fixes", "").split(),
+        }
+
+
+class CompactRows:
+    # A finished table kept as one tuple per row instead of one dict (a third
+    # of the memory, and less to pickle between processes); iterating gives
+    # dicts again. Rows missing a later-seen field (fixes have no nav_name)
+    # come back without it.
+    __slots__ = ("fields", "values")
+
+    def __init__(self, rows):
+        self.fields, self.values = (), []
+        for row in rows:
+            keys = tuple(row)
+            if keys == self.fields:
+                self.values.append(tuple(row.values()))
+                continue
+            self.fields += tuple(key for key in keys if key not in self.fields)
+            self.values.append(tuple(row.get(field) for field in self.fields))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        fields = self.fields
+        for values in self.values:
+            yield dict(zip(fields, values))
+
+
+def unique_rows(rows, key: str):
+    # First row wins, same as create_many(skip_duplicates=True) run in order
+    seen = set()
+    for row in rows:
+        if row[key] not in seen:
+            seen.add(row[key])
+            yield row
+
+
+def table_rows(airac: str, table: str, stream: bool = False, parsed: dict = None):
+    # Rows for one Prisma model, without duplicate keys. parsed can also hold
+    # a table's finished rows under "table:<name>" (see pipeline.py)
+    if parsed and f"table:{table}" in parsed:
+        return parsed[f"table:{table}"]
+    rows = metrics.count(source_rows(airac, table, stream, parsed))
+    if table in KEYS:
+        return unique_rows(rows, KEYS[table])
+    return rows
+
+
+def source_rows(airac: str, table: str, stream: bool = False, parsed: dict = None):
+    # fixes and navaids both end up in the fix table
+    if table == "airport":
+        return with_geohash(entity_rows(read_dataset(airac, "apt", stream, parsed), APT_MAPPING))
+    if table == "airway":
+        return airway_rows(read_dataset(airac, "awy", stream, parsed))
+    if table == "route":
+        return faa_route_rows(read_dataset(airac, "faa", stream, parsed))
+    if table == "fix":
+        return with_geohash(chain(
+            entity_rows(read_dataset(airac, "fixes", stream, parsed), FIX_MAPPING),
+            entity_rows(read_dataset(airac, "nav", stream, parsed), NAV_MAPPING),
+        ))
+    if table == "sid":
+        return sid_rows(read_dataset(airac, "sid", stream, parsed))
+    if table == "star":
+        return star_rows(read_dataset(airac, "star", stream, parsed))
+    raise ValueError(f"Unknown table: {table}")
+
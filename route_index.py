@@ -0,0 +1,77 @@
+from collections import namedtuple
+from snapshot import Snapshot
+
+# In-process preferred route lookup. Routes are kept as tuples and indexed in
+# plain dicts by origin/destination pair, origin, destination and ARTCC pair
+# (DCNTR/ACNTR), so a query is one dict lookup plus a filter over the handful
+# of routes under that key. Aircraft and direction are structured fields, not
+# part of a notes string; a route without a qualifier applies to everyone.
+# The prefroutes file has no TRACON column, so centers are the coarsest key.
+#
+#   index = load_route_index("data/2603/navdata.snap")
+#   index.lookup(dep="ORD", dest="LGA", aircraft="JETS")
+
+Route = namedtuple("Route", ["dep", "dest", "route", "aircraft", "direction", "route_type", "dep_artcc", "dest_artcc"])
+
+
+def airport_keys(code):
+    # prefroutes uses FAA identifiers (ORD), callers often ICAO (KORD)
+    if code and len(code) == 4 and code.startswith("K"):
+        return (code, code[1:])
+    return (code,)
+
+
+class RouteIndex:
+    def __init__(self, rows):
+        self.routes = [Route(*(row.get(field) for field in Route._fields)) for row in rows]
+
+        self.by_pair, self.by_dep, self.by_dest, self.by_artcc = {}, {}, {}, {}
+        for i, route in enumerate(self.routes):
+            self.by_pair.setdefault((route.dep, route.dest), []).append(i)
+            self.by_dep.setdefault(route.dep, []).append(i)
+            self.by_dest.setdefault(route.dest, []).append(i)
+            self.by_artcc.setdefault((route.dep_artcc, route.dest_artcc), []).append(i)
+
+    def __len__(self):
+        return len(self.routes)
+
+    def candidates(self, dep, dest, dep_artcc, dest_artcc):
+        # Positions under the most selective key the query has
+        if dep and dest:
+            return [i for d in airport_keys(dep) for a in airport_keys(dest) for i in self.by_pair.get((d, a), ())]
+        if dep:
+            return [i for d in airport_keys(dep) for i in self.by_dep.get(d, ())]
+        if dest:
+            return [i for a in airport_keys(dest) for i in self.by_dest.get(a, ())]
+        if dep_artcc and dest_artcc:
+            return self.by_artcc.get((dep_artcc, dest_artcc), [])
+        if dep_artcc or dest_artcc:
+            return [i for (d, a), positions in self.by_artcc.items()
+                    if dep_artcc in (None, d) and dest_artcc in (None, a) for i in positions]
+        return range(len(self.routes))
+
+    def lookup(self, dep=None, dest=None, dep_artcc=None, dest_artcc=None, aircraft=None, direction=None,
+               route_type=None):
+        # Routes matching every given criterion, in file order
+        found = []
+        for i in sorted(self.candidates(dep, dest, dep_artcc, dest_artcc)):
+            route = self.routes[i]
+            if dep_artcc and route.dep_artcc != dep_artcc:
+                continue
+            if dest_artcc and route.dest_artcc != dest_artcc:
+                continue
+            if aircraft and route.aircraft not in (None, aircraft):
+                continue
+            if direction and route.direction not in (None, direction):
+                continue
+            if route_type and route.route_type != route_type:
+                continue
+            found.append(route)
+        return found
+
+
+def load_route_index(snapshot_path):
+    # From a cycle snapshot (only FAA routes are in it, custom ones live in the database)
+    with Snapshot(snapshot_path) as snapshot:
+        rows = list(snapshot.table("route").rows(list(Route._fields)))
+    return RouteIndex(rows)
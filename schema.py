@@ -0,0 +1,66 @@
+import os, re
+from collections import namedtuple
+from functools import lru_cache
+
+# Minimal reader for the models in schema.prisma, so raw SQL paths use the
+# same table and column names as the Prisma client.
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.prisma")
+
+Field = namedtuple("Field", ["name", "type", "is_list", "optional", "is_id", "autoincrement"])
+Model = namedtuple("Model", ["name", "fields", "indexes"])
+
+MODEL_RE = re.compile(r"^model\s+(\w+)\s*\{(.*?)^\}", re.MULTILINE | re.DOTALL)
+FIELD_RE = re.compile(r"^(\w+)\s+(\w+)(\[\])?(\?)?(.*)$")
+INDEX_RE = re.compile(r"^@@index\(\[([^\]]*)\]")
+
+
+def parse_schema(path=SCHEMA_PATH):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    models = {}
+    for name, body in MODEL_RE.findall(text):
+        fields, indexes = [], []
+        for line in body.splitlines():
+            line = line.split("//")[0].strip()
+            if not line:
+                continue
+
+            index = INDEX_RE.match(line)
+            if index:
+                indexes.append([column.strip() for column in index.group(1).split(",")])
+                continue
+
+            match = FIELD_RE.match(line)
+            if match:
+                field_name, field_type, is_list, optional, attributes = match.groups()
+                fields.append(Field(
+                    field_name,
+                    field_type,
+                    bool(is_list),
+                    bool(optional),
+                    "@id" in attributes,
+                    "autoincrement()" in attributes,
+                ))
+
+        models[name] = Model(name, fields, indexes)
+    return models
+
+
+@lru_cache(maxsize=None)
+def model_for(table: str):
+    # "fix" -> the Fix model, matching the Prisma client's db.fix accessor
+    for name, model in parse_schema().items():
+        if name.lower() == table:
+            return model
+    raise ValueError(f"No model for table {table} in schema.prisma")
+
+
+def insert_fields(model):
+    # Columns we write; autoincrement ids are left to their sequence
+    return [field for field in model.fields if not field.autoincrement]
+
+
+def primary_key(model):
+    return [field.name for field in model.fields if field.is_id]
@@ -0,0 +1,258 @@
+import json, os, sqlite3
+import metrics
+from records import table_rows, table_sources
+from schema import model_for, insert_fields, primary_key
+from utils import batched
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for Parquet output
+    pa = pq = None
+
+# File outputs for a cycle's tables, next to (or instead of) the Postgres
+# load: an embedded SQLite database (data/<airac>/navdata.sqlite) with the
+# schema.prisma tables, primary keys and indexes, and one Parquet file per
+# table (data/<airac>/parquet/<table>.parquet, needs pyarrow). Columns come
+# from schema.prisma; String[] columns are JSON text in SQLite and lists in
+# Parquet.
+#
+# Each sink hands out one writer per table, closed once every row is written
+# or aborted (leaving no partial table or file behind) if the load fails. The
+# SQLite database is written in one transaction, committed by the sink's
+# close() only if every writer finished; close() returns the tables written,
+# which close_sinks() records in the manifest. When Postgres is loaded too,
+# db.update passes its rows through tee_rows on the way, so every output is
+# written in the same pass over the source files; otherwise export() reads
+# each table once for all the sinks.
+
+# ---- CONFIG ----
+BATCH_ROWS = 5000
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+# ----------------
+
+SQLITE_TYPES = {"Decimal": "REAL", "Int": "INTEGER"}
+
+
+def sqlite_value(field, value):
+    # Lists as JSON text, SQLite has no array type
+    if field.is_list:
+        return json.dumps(list(value or []))
+    if field.type == "Decimal":
+        return float(value) if value not in (None, "") else None
+    return value
+
+
+class SQLiteSink:
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self.open = 0  # writers neither closed nor aborted
+        self.failed = False
+        self.written = []
+
+    def outputs(self, table):
+        return [self.path]
+
+    def connect(self):
+        # Opened on first use; tables written concurrently share the connection
+        # and its one transaction (SQLite has a single writer per database anyway)
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(self.path, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.execute("BEGIN")
+        return self.conn
+
+    def writer(self, table):
+        self.open += 1
+        return SQLiteWriter(self, table)
+
+    def close(self):
+        # Commit if every writer finished, otherwise nothing of this run is kept
+        written = []
+        if self.conn is not None:
+            if self.failed or self.open:
+                self.conn.rollback()
+            else:
+                self.conn.commit()
+                written = self.written
+            self.conn.close()
+            self.conn = None
+        self.open, self.failed, self.written = 0, False, []
+        return written
+
+
+class SQLiteWriter:
+    # Same shape as a staged load: recreate the table, bulk insert, then build the indexes
+    def __init__(self, sink, table):
+        self.sink = sink
+        self.conn = conn = sink.connect()
+        self.table = table
+        self.model = model_for(table)
+        self.fields = insert_fields(self.model)
+        self.count = 0
+
+        columns = []
+        for field in self.model.fields:
+            if field.autoincrement:
+                columns.append(f'"{field.name}" INTEGER PRIMARY KEY')
+            else:
+                kind = "TEXT" if field.is_list else SQLITE_TYPES.get(field.type, "TEXT")
+                columns.append(f'"{field.name}" {kind}')
+        if any(field.is_id and not field.autoincrement for field in self.model.fields):
+            columns.append(f'PRIMARY KEY ({", ".join(primary_key(self.model))})')
+
+        conn.execute(f'DROP TABLE IF EXISTS "{self.model.name}"')
+        conn.execute(f'CREATE TABLE "{self.model.name}" ({", ".join(columns)})')
+
+        names = ", ".join(f'"{field.name}"' for field in self.fields)
+        self.query = f'INSERT OR IGNORE INTO "{self.model.name}" ({names}) VALUES ({", ".join("?" * len(self.fields))})'
+
+    def write(self, rows):
+        self.conn.executemany(self.query, [tuple(sqlite_value(field, row.get(field.name)) for field in self.fields)
+                                           for row in rows])
+        self.count += len(rows)
+
+    def close(self):
+        for columns in self.model.indexes:
+            name = f"{self.model.name}_{'_'.join(columns)}_idx"
+            self.conn.execute(f'CREATE INDEX "{name}" ON "{self.model.name}" ({", ".join(columns)})')
+        self.sink.open -= 1
+        self.sink.written.append(self.table)
+        return self.count
+
+    def abort(self):
+        # The sink rolls the whole transaction back on close
+        self.sink.open -= 1
+        self.sink.failed = True
+
+
+def arrow_type(field):
+    kind = {"Decimal": pa.float64(), "Int": pa.int64()}.get(field.type, pa.string())
+    return pa.list_(kind) if field.is_list else kind
+
+
+def arrow_value(field, value):
+    if value in (None, ""):
+        return [] if field.is_list else None
+    if field.is_list:
+        return list(value)
+    if field.type == "Decimal":
+        return float(value)
+    return value
+
+
+class ParquetSink:
+    name = "parquet"
+
+    def __init__(self, folder):
+        if pa is None:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+        self.folder = folder
+        self.written = []
+
+    def outputs(self, table):
+        return [os.path.join(self.folder, f"{table}.parquet")]
+
+    def writer(self, table):
+        os.makedirs(self.folder, exist_ok=True)
+        return ParquetWriter(self, table)
+
+    def close(self):
+        # Each file is complete on its own, so every finished table counts
+        written, self.written = self.written, []
+        return written
+
+
+class ParquetWriter:
+    # Written next to the target and renamed when complete, like the snapshot
+    def __init__(self, sink, table):
+        self.sink = sink
+        self.table = table
+        self.path = path = sink.outputs(table)[0]
+        self.fields = insert_fields(model_for(table))
+        self.schema = pa.schema([pa.field(field.name, arrow_type(field)) for field in self.fields])
+        self.writer = pq.ParquetWriter(f"{path}.tmp", self.schema, compression=PARQUET_COMPRESSION)
+        self.count = 0
+
+    def write(self, rows):
+        columns = {field.name: [arrow_value(field, row.get(field.name)) for row in rows] for field in self.fields}
+        self.writer.write_table(pa.Table.from_pydict(columns, schema=self.schema))
+        self.count += len(rows)
+
+    def close(self):
+        self.writer.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        self.sink.written.append(self.table)
+        return self.count
+
+    def abort(self):
+        self.writer.close()
+        if os.path.exists(f"{self.path}.tmp"):
+            os.remove(f"{self.path}.tmp")
+
+
+SINKS = {"sqlite": SQLiteSink, "parquet": ParquetSink}
+
+
+def open_sinks(airac, names):
+    # File sinks for the given output names ("postgres" is db.update's, not a sink here)
+    paths = {"sqlite": f"data/{airac}/navdata.sqlite", "parquet": f"data/{airac}/parquet"}
+    return [SINKS[name](paths[name]) for name in names if name in SINKS]
+
+
+def tee_rows(rows, writers, batch_rows=BATCH_ROWS):
+    # Pass rows through unchanged while writing them to each writer in
+    # batches; the writers are closed once the rows run out, or aborted if
+    # reading fails or the generator is closed before then
+    batch, done = [], False
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                for writer in writers:
+                    writer.write(batch)
+                batch = []
+            yield row
+        for writer in writers:
+            if batch:
+                writer.write(batch)
+        done = True
+    finally:
+        for writer in writers:
+            writer.close() if done else writer.abort()
+
+
+def write_rows(sink, table, rows):
+    # One table into one sink; returns the rows written
+    writer = sink.writer(table)
+    try:
+        for batch in batched(rows, BATCH_ROWS):
+            writer.write(batch)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def close_sinks(sinks, manifest=None, airac=None):
+    # Close every sink and record the tables it kept as "<sink>:<table>",
+    # like "load:<table>" for Postgres
+    for sink in sinks:
+        for table in sink.close():
+            if manifest:
+                manifest.mark(f"{sink.name}:{table}", table_sources(airac, table))
+
+
+def export(airac, tables, parsed=None):
+    # {table: [sinks]} for tables that aren't going to Postgres this run: each
+    # is read once (streamed, or from parsed) for all of its sinks
+    for table, table_sinks in tables.items():
+        with metrics.stage(f"export:{table}", bytes_read=metrics.file_bytes(table_sources(airac, table))) as stage:
+            writers = [sink.writer(table) for sink in table_sinks]
+            stage.rows_out = sum(1 for _ in tee_rows(table_rows(airac, table, True, parsed), writers))
+        print(f"{table}: wrote {stage.rows_out} records to {', '.join(sink.name for sink in table_sinks)}")
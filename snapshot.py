@@ -0,0 +1,259 @@
+import json, mmap, os, struct, sys
+from array import array
+from schema import model_for, insert_fields
+
+# Compact per-cycle snapshot of the processed navdata (data/<airac>/navdata.snap).
+#
+# Layout (little-endian):
+#   b"NAVSNAP\0" | version u32 | header length u32 | header JSON | column data
+#
+# The JSON header lists every table's row count and, per column, its kind
+# and where its arrays live. Column data is stored as plain arrays aligned to
+# 8 bytes, so a reader can mmap the file and view them without copying:
+#   f64      float64 per row (NaN for missing), e.g. lat/lon
+#   str      uint32 index into the shared string table (NONE for missing)
+#   strlist  uint32 offsets (rows + 1) into a flat uint32 array of string indexes
+#   f64list  uint32 offsets (rows + 1) into a flat float64 array
+# Identifiers are interned once in the string table: uint32 offsets
+# (count + 1) into one UTF-8 blob.
+
+MAGIC = b"NAVSNAP\0"
+# Bumped whenever the tables or columns written change, so older snapshots
+# are rejected and rebuilt (2: route qualifiers and geohash columns)
+VERSION = 2
+NONE = 0xFFFFFFFF
+SNAPSHOT_NAME = "navdata.snap"
+
+if sys.byteorder != "little":
+    raise ImportError("snapshot.py reads arrays in place and needs a little-endian machine")
+
+
+def snapshot_path(airac):
+    return f"data/{airac}/{SNAPSHOT_NAME}"
+
+
+def is_current(path):
+    # Whether path is a snapshot this version of the code can read
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as f:
+        head = f.read(len(MAGIC) + 4)
+    return len(head) == len(MAGIC) + 4 and head[:len(MAGIC)] == MAGIC and \
+        struct.unpack_from("<I", head, len(MAGIC))[0] == VERSION
+
+
+def table_kinds(table):
+    # Column kinds from schema.prisma: Decimal -> f64, String[] -> strlist, everything else str
+    kinds = {}
+    for field in insert_fields(model_for(table)):
+        if field.type == "Decimal":
+            kinds[field.name] = "f64"
+        elif field.is_list:
+            kinds[field.name] = "strlist"
+        else:
+            kinds[field.name] = "str"
+    return kinds
+
+
+class StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.offsets = array("I", [0])
+        self.data = bytearray()
+
+    def intern(self, value):
+        if value is None:
+            return NONE
+        value = str(value)
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.offsets) - 1
+            self.data += value.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return index
+
+
+def build_columns(rows, kinds, strings):
+    columns = {}
+    for name, kind in kinds.items():
+        if kind == "f64":
+            columns[name] = {"values": array("d")}
+        elif kind == "str":
+            columns[name] = {"values": array("I")}
+        elif kind == "strlist":
+            columns[name] = {"offsets": array("I", [0]), "values": array("I")}
+        elif kind == "f64list":
+            columns[name] = {"offsets": array("I", [0]), "values": array("d")}
+        else:
+            raise ValueError(f"Unknown column kind: {kind}")
+
+    count = 0
+    for row in rows:
+        count += 1
+        for name, kind in kinds.items():
+            value = row.get(name)
+            column = columns[name]
+            if kind == "f64":
+                column["values"].append(float(value) if value not in (None, "") else float("nan"))
+            elif kind == "str":
+                column["values"].append(strings.intern(value))
+            elif kind == "strlist":
+                column["values"].extend(strings.intern(v) for v in value or [])
+                column["offsets"].append(len(column["values"]))
+            else:
+                column["values"].extend(float(v) for v in value or [])
+                column["offsets"].append(len(column["values"]))
+
+    return count, columns
+
+
+def write_snapshot(path, tables, kinds=None):
+    # tables: {name: rows}; kinds overrides the schema-derived column kinds per table
+    kinds = kinds or {}
+    strings = StringTable()
+    built = {}
+    for name, rows in tables.items():
+        table_kind = kinds.get(name) or table_kinds(name)
+        built[name] = (table_kind, *build_columns(rows, table_kind, strings))
+
+    # Lay out every array after the header, each aligned to 8 bytes; offsets in
+    # the header are relative to the start of the data section
+    blobs = []
+    position = 0
+
+    def place(arr):
+        nonlocal position
+        data = arr.tobytes()
+        padding = -position % 8
+        blobs.append(b"\0" * padding + data)
+        position += padding
+        entry = {"offset": position, "length": len(arr)}
+        position += len(data)
+        return entry
+
+    header = {
+        "strings": {"offsets": place(strings.offsets), "data": place(array("B", strings.data))},
+        "tables": {},
+    }
+    for name, (table_kind, count, columns) in built.items():
+        header["tables"][name] = {
+            "rows": count,
+            "columns": {
+                column: {"kind": table_kind[column], **{part: place(arr) for part, arr in parts.items()}}
+                for column, parts in columns.items()
+            },
+        }
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    start = len(MAGIC) + 8 + len(header_bytes)
+    start += -start % 8
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<II", VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (start - len(MAGIC) - 8 - len(header_bytes)))
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+    print(f"Wrote snapshot {path} ({', '.join(f'{n}: {b[1]}' for n, b in built.items())})")
+
+
+class Snapshot:
+    # Read-only view of a snapshot file. Columns are memoryviews straight
+    # into the mapping, so release them before calling close().
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        if self._view[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a navdata snapshot")
+        version, header_length = struct.unpack_from("<II", self._map, len(MAGIC))
+        if version != VERSION:
+            raise ValueError(f"{path} is snapshot version {version}, expected {VERSION}")
+
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self._view[header_start:header_start + header_length]))
+        self._base = header_start + header_length + (-(header_start + header_length) % 8)
+
+        self._string_offsets = self._array(self.header["strings"]["offsets"], "I")
+        self._string_data = self._array(self.header["strings"]["data"], "B")
+
+    def _array(self, entry, fmt):
+        start = self._base + entry["offset"]
+        size = struct.calcsize(fmt)
+        return self._view[start:start + entry["length"] * size].cast(fmt)
+
+    def string(self, index):
+        if index == NONE:
+            return None
+        return bytes(self._string_data[self._string_offsets[index]:self._string_offsets[index + 1]]).decode("utf-8")
+
+    @property
+    def tables(self):
+        return list(self.header["tables"])
+
+    def table(self, name):
+        return SnapshotTable(self, name)
+
+    def close(self):
+        self._string_offsets.release()
+        self._string_data.release()
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SnapshotTable:
+    def __init__(self, snapshot, name):
+        self.snapshot = snapshot
+        self.name = name
+        self.info = snapshot.header["tables"][name]
+        self.kinds = {column: info["kind"] for column, info in self.info["columns"].items()}
+
+    def __len__(self):
+        return self.info["rows"]
+
+    def column(self, name):
+        # f64/str columns as a flat memoryview; list columns as (offsets, values)
+        info = self.info["columns"][name]
+        fmt = "d" if info["kind"] in ("f64", "f64list") else "I"
+        values = self.snapshot._array(info["values"], fmt)
+        if "offsets" in info:
+            return self.snapshot._array(info["offsets"], "I"), values
+        return values
+
+    def rows(self, columns=None):
+        # Decoded rows as dicts, in the order they were written
+        columns = columns or list(self.kinds)
+        data = {column: self.column(column) for column in columns}
+        string = self.snapshot.string
+
+        for i in range(len(self)):
+            row = {}
+            for column in columns:
+                kind = self.kinds[column]
+                if kind == "f64":
+                    value = data[column][i]
+                    row[column] = None if value != value else value
+                elif kind == "str":
+                    row[column] = string(data[column][i])
+                else:
+                    offsets, values = data[column]
+                    items = values[offsets[i]:offsets[i + 1]]
+                    row[column] = [string(v) for v in items] if kind == "strlist" else list(items)
+            yield row
+
+    def __iter__(self):
+        return self.rows()
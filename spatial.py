@@ -0,0 +1,122 @@
+import math
+import numpy as np
+from snapshot import NONE, Snapshot
+
+# In-process spatial index over fixes, navaids and airports. Points are
+# bucketed into a lat/lon grid (sorted by cell, one contiguous slice per
+# cell), so a radius or nearest query only looks at the few cells around the
+# target and computes distances for those candidates in one vectorized pass.
+
+EARTH_RADIUS_NM = 3440.065
+CELL_DEGREES = 0.25
+
+
+def haversine_nm(lat, lon, lats, lons):
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    def __init__(self, idents, lats, lons, kinds=None, cell_degrees=CELL_DEGREES):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        valid = ~(np.isnan(lats) | np.isnan(lons))
+
+        self.cell_degrees = cell_degrees
+        self.columns = int(math.ceil(360 / cell_degrees))
+
+        keys = self._cell(lats[valid], lons[valid])
+        order = np.argsort(keys, kind="stable")
+
+        self.idents = np.asarray(idents, dtype=object)[valid][order]
+        self.kinds = np.asarray(kinds if kinds is not None else [None] * len(lats), dtype=object)[valid][order]
+        self.lats = lats[valid][order]
+        self.lons = lons[valid][order]
+
+        # {cell key: (start, end)} into the sorted arrays
+        sorted_keys = keys[order]
+        cells, starts = np.unique(sorted_keys, return_index=True)
+        ends = np.append(starts[1:], len(sorted_keys))
+        self.cells = dict(zip(cells.tolist(), zip(starts.tolist(), ends.tolist())))
+
+    def __len__(self):
+        return len(self.idents)
+
+    def _row_col(self, lats, lons):
+        rows = np.floor((np.asarray(lats) + 90) / self.cell_degrees).astype(np.int64)
+        cols = np.floor((np.asarray(lons) + 180) / self.cell_degrees).astype(np.int64) % self.columns
+        return rows, cols
+
+    def _cell(self, lats, lons):
+        rows, cols = self._row_col(lats, lons)
+        return rows * self.columns + cols
+
+    def _candidates(self, lat, lon, radius_nm):
+        # Indexes of every point in the cells overlapping the query's bounding box
+        dlat = radius_nm / 60.0
+        coslat = max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        dlon = min(radius_nm / (60.0 * coslat), 180.0)
+
+        (row0, row1), _ = self._row_col([lat - dlat, lat + dlat], [lon, lon])
+        col_span = int(math.ceil(dlon / self.cell_degrees))
+        _, col = self._row_col([lat], [lon])
+        col = int(col[0])
+        cols = {(col + c) % self.columns for c in range(-col_span, col_span + 1)}
+
+        slices = []
+        for row in range(int(row0), int(row1) + 1):
+            for c in cols:
+                cell = self.cells.get(row * self.columns + c)
+                if cell:
+                    slices.append(np.arange(*cell))
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def within(self, lat, lon, radius_nm, kind=None):
+        # [(ident, kind, distance_nm)] within radius_nm, nearest first
+        candidates = self._candidates(lat, lon, radius_nm)
+        if kind is not None and len(candidates):
+            candidates = candidates[self.kinds[candidates] == kind]
+
+        distances = haversine_nm(lat, lon, self.lats[candidates], self.lons[candidates])
+        inside = distances <= radius_nm
+        candidates, distances = candidates[inside], distances[inside]
+
+        order = np.argsort(distances, kind="stable")
+        return [(self.idents[i], self.kinds[i], float(d)) for i, d in zip(candidates[order], distances[order])]
+
+    def nearest(self, lat, lon, k=1, kind=None, max_radius_nm=3000.0):
+        # k closest points, searching outwards until enough are found
+        radius = self.cell_degrees * 60.0
+        while True:
+            found = self.within(lat, lon, radius, kind)
+            if len(found) >= k or radius >= max_radius_nm:
+                return found[:k]
+            radius = min(radius * 2, max_radius_nm)
+
+
+def load_index(snapshot_path, tables=("fix", "airport")):
+    # Build the index from a cycle snapshot; kind is "fix", "navaid" or "airport"
+    idents, lats, lons, kinds = [], [], [], []
+
+    with Snapshot(snapshot_path) as snapshot:
+        for table in tables:
+            data = snapshot.table(table)
+            key = "code" if table == "airport" else "fix_id"
+
+            columns = {name: data.column(name) for name in (key, "lat", "lon")}
+            idents.extend(snapshot.string(i) for i in columns[key])
+            lats.append(np.array(columns["lat"]))
+            lons.append(np.array(columns["lon"]))
+
+            if table == "fix":
+                columns["nav_name"] = data.column("nav_name")
+                kinds.extend("fix" if i == NONE else "navaid" for i in columns["nav_name"])
+            else:
+                kinds.extend([table] * len(data))
+
+            for view in columns.values():
+                view.release()
+
+    return SpatialIndex(idents, np.concatenate(lats), np.concatenate(lons), kinds)
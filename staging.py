@@ -0,0 +1,174 @@
+import json, os
+from datetime import timedelta
+from airac import DATA_ROOT
+from batching import send_batches
+from pg_copy import copy_rows
+from schema import model_for, insert_fields, primary_key
+
+# Staging-and-swap: each cycle is bulk-loaded into unlogged "<Table>_new" shadow
+# tables without indexes, indexed afterwards, and made live for every table in
+# one transaction by renaming. The replaced tables stay around as
+# "<Table>_prev" until the next swap, so a bad cycle can be rolled back.
+# Only stale tables are staged, so each swap records which tables it replaced
+# (data/last-swap.json) and a rollback only puts those back.
+# The shadow tables are not part of schema.prisma; don't run `prisma db push`
+# while a cycle is staged.
+
+# DDL for all tables runs in one transaction, allow it more than Prisma's default 5s
+SWAP_TIMEOUT = timedelta(seconds=60)
+SWAP_RECORD = os.path.join(DATA_ROOT, "last-swap.json")
+
+# Rows kept from the live table when it is staged (see db.OWNED)
+KEEP = {"route": "\"source\" <> 'faa'"}
+
+
+def spec(table: str):
+    # Table name, columns, primary key and indexes as declared in schema.prisma
+    model = model_for(table)
+    # autoincrement ids use Postgres' default "<Table>_<column>_seq"
+    sequences = [field.name for field in model.fields if field.autoincrement]
+    return {
+        "table": model.name,
+        "columns": [field.name for field in insert_fields(model)],
+        "pkey": primary_key(model),
+        "indexes": model.indexes,
+        "sequence_column": sequences[0] if sequences else None,
+    }
+
+
+def quoted(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def index_name(table, suffix, columns):
+    # Prisma's default name is "<Table>_<col>_<col>_idx"
+    return f"{table}{suffix}_{'_'.join(columns)}_idx"
+
+
+async def prepare(db, table: str):
+    base = model_for(table).name
+    await db.execute_raw(f'DROP TABLE IF EXISTS "{base}_new"')
+    await db.execute_raw(f'CREATE UNLOGGED TABLE "{base}_new" (LIKE "{base}" INCLUDING DEFAULTS)')
+    if table in KEEP:
+        # rows the update doesn't own carry over into the new table as they are
+        await db.execute_raw(f'INSERT INTO "{base}_new" SELECT * FROM "{base}" WHERE {KEEP[table]}')
+
+
+async def load(db, table: str, rows, pool=None):
+    # With a COPY pool the rows are streamed in; otherwise each batch goes over
+    # as a single JSON parameter, which also covers the String[] and Decimal
+    # columns without any per-type handling
+    table_spec = spec(table)
+    base, columns = table_spec["table"], quoted(table_spec["columns"])
+    if pool:
+        return await copy_rows(pool, table, rows, target=f"{base}_new")
+
+    query = (
+        f'INSERT INTO "{base}_new" ({columns}) '
+        f'SELECT {columns} FROM json_populate_recordset(NULL::"{base}_new", $1::json)'
+    )
+
+    async def send(batch):
+        return await db.execute_raw(query, json.dumps(batch, default=str))
+
+    return await send_batches(send, rows, f"{table} (staging)")
+
+
+async def finalize(db, table: str):
+    # Indexes are built once the data is in, which is much cheaper than maintaining them per row
+    table_spec = spec(table)
+    base = table_spec["table"]
+
+    await db.execute_raw(f'ALTER TABLE "{base}_new" SET LOGGED')
+    await db.execute_raw(f'ALTER TABLE "{base}_new" ADD CONSTRAINT "{base}_new_pkey" PRIMARY KEY ({quoted(table_spec["pkey"])})')
+    for columns in table_spec["indexes"]:
+        await db.execute_raw(f'CREATE INDEX "{index_name(base, "_new", columns)}" ON "{base}_new" ({quoted(columns)})')
+    await db.execute_raw(f'ANALYZE "{base}_new"')
+
+
+async def stage_table(db, table: str, rows, pool=None):
+    await prepare(db, table)
+    result = await load(db, table, rows, pool)
+    await finalize(db, table)
+    print(f"{table}: staged {result} records")
+
+
+async def rename(tx, table: str, src: str, dst: str):
+    # Rename "<Table><src>" to "<Table><dst>" along with its primary key and indexes
+    table_spec = spec(table)
+    base = table_spec["table"]
+
+    await tx.execute_raw(f'ALTER TABLE "{base}{src}" RENAME TO "{base}{dst}"')
+    await tx.execute_raw(f'ALTER TABLE "{base}{dst}" RENAME CONSTRAINT "{base}{src}_pkey" TO "{base}{dst}_pkey"')
+    for columns in table_spec["indexes"]:
+        await tx.execute_raw(f'ALTER INDEX "{index_name(base, src, columns)}" RENAME TO "{index_name(base, dst, columns)}"')
+
+
+async def own_sequence(tx, table: str):
+    # Dropping "<Table>_prev" later must not take the live table's id sequence with it
+    table_spec = spec(table)
+    base, column = table_spec["table"], table_spec["sequence_column"]
+    if column:
+        await tx.execute_raw(f'ALTER SEQUENCE "{base}_{column}_seq" OWNED BY "{base}"."{column}"')
+
+
+async def swap(db, tables):
+    # Make every staged table live at once
+    async with db.tx(timeout=SWAP_TIMEOUT) as tx:
+        for table in tables:
+            await tx.execute_raw(f'DROP TABLE IF EXISTS "{model_for(table).name}_prev"')
+            await rename(tx, table, "", "_prev")
+            await rename(tx, table, "_new", "")
+            await own_sequence(tx, table)
+
+    print(f"Swapped in staged tables: {', '.join(tables)}")
+
+
+async def existing(tx, tables, suffix=""):
+    # Tables whose "<Table><suffix>" is in the database
+    found = []
+    for table in tables:
+        rows = await tx.query_raw("SELECT to_regclass($1)::text AS name", f'"{model_for(table).name}{suffix}"')
+        if rows and rows[0]["name"]:
+            found.append(table)
+    return found
+
+
+async def rollback(db, tables):
+    # Swap the live tables with the ones kept from the previous cycle;
+    # tables without a "<Table>_prev" are left as they are. Returns the tables rolled back
+    async with db.tx(timeout=SWAP_TIMEOUT) as tx:
+        previous = await existing(tx, tables, "_prev")
+        for table in previous:
+            await rename(tx, table, "", "_tmp")
+            await rename(tx, table, "_prev", "")
+            await rename(tx, table, "_tmp", "_prev")
+            await own_sequence(tx, table)
+
+    skipped = [table for table in tables if table not in previous]
+    if skipped:
+        print(f"No previous tables kept for {', '.join(skipped)}, left as they are")
+    if previous:
+        print(f"Rolled back to previous tables: {', '.join(previous)}")
+    return previous
+
+
+def write_swap_record(airac, tables):
+    os.makedirs(os.path.dirname(SWAP_RECORD), exist_ok=True)
+    tmp_path = f"{SWAP_RECORD}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"airac": airac, "tables": list(tables)}, f, indent=4)
+    os.replace(tmp_path, SWAP_RECORD)
+
+
+def read_swap_record():
+    # {"airac": ..., "tables": [...]} of the last swap, or None once it has been rolled back
+    if not os.path.exists(SWAP_RECORD):
+        return None
+    with open(SWAP_RECORD, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def clear_swap_record():
+    if os.path.exists(SWAP_RECORD):
+        os.remove(SWAP_RECORD)
@@ -0,0 +1,216 @@
+import csv, os, random
+from datasets import source_path
+
+# Synthetic NASR/prefroutes files shaped like the real ones (same headers and
+# encodings, roughly the same row counts and route structure at scale 1), for
+# benchmarking without downloading a cycle. Generation is seeded, so the same
+# scale always produces the same files.
+
+# Rows at scale 1, about the size of a current NASR subscription
+COUNTS = {
+    "fix": 70000,
+    "nav": 1700,
+    "apt": 19700,
+    "awy": 1500,
+    "sid": 1400,
+    "star": 700,
+    "faa": 13000,
+}
+
+EFF_DATE = "2026/03/19"
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+ARTCCS = ["ZAB", "ZAU", "ZBW", "ZDC", "ZDV", "ZFW", "ZHU", "ZID", "ZJX", "ZKC", "ZLA", "ZLC", "ZMA", "ZME", "ZMP",
+          "ZNY", "ZOA", "ZOB", "ZSE", "ZTL"]
+NAV_NAMES = ["BRADFORD", "SAN JOSÉ", "PEÑASCO", "CHICAGO HEIGHTS", "OBSTRUCTION", "DUPAGE", "JOLIET"]
+
+
+def idents(count, length, rng):
+    # count distinct letter identifiers, at least `length` long (longer if they don't fit)
+    while len(LETTERS) ** length < count * 2:
+        length += 1
+    space = len(LETTERS) ** length
+    chosen = rng.sample(range(space), count)
+
+    result = []
+    for n in chosen:
+        chars = []
+        for _ in range(length):
+            n, i = divmod(n, len(LETTERS))
+            chars.append(LETTERS[i])
+        result.append("".join(chars))
+    return result
+
+
+def coordinate(rng):
+    return f"{rng.uniform(24.5, 49.0):.8f}", f"{rng.uniform(-124.7, -67.0):.8f}"
+
+
+def write_csv(path, header, rows, encoding="utf-8"):
+    with open(path, "w", newline="", encoding=encoding) as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def procedure_rows(kind, count, fixes, airports, rng):
+    # Base and route rows for count procedures; SIDs are NAME#.TRANSITION with
+    # the body named after the procedure, STARs TRANSITION.NAME#
+    base, route = [], []
+    names = idents(count, 5, rng)
+    for name in names:
+        name = f"{name}{rng.randint(1, 9)}"
+        body = rng.sample(fixes, rng.randint(2, 6))
+        code = f"{name}.{name[:-1]}" if kind == "sid" else f"{name[:-1]}.{name}"
+        artcc = rng.choice(ARTCCS)
+        for airport in rng.sample(airports, rng.randint(1, 3)):
+            base.append((code, artcc, airport))
+
+        runways = [f"RW{rng.randint(1, 36):02d}{rng.choice(['', 'L', 'R'])}" for _ in range(rng.randint(1, 4))]
+        for runway in runways:
+            points = body if rng.random() < 0.7 else body[:-1] + [rng.choice(fixes)]
+            for seq, point in enumerate(reversed(points), 1):
+                route.append((code, "BODY", "", seq, point, runway, artcc))
+
+        for _ in range(rng.randint(0, 5)):
+            points = rng.sample(fixes, rng.randint(2, 5))
+            if kind == "sid":
+                points[0] = body[-1]
+                transition = f"{name}.{points[-1]}"
+            else:
+                points[-1] = body[0]
+                transition = f"{points[0]}.{name}"
+            for seq, point in enumerate(reversed(points), 1):
+                route.append((code, "TRANSITION", transition, seq, point, "", artcc))
+
+    return base, route
+
+
+def generate(airac, scale=1, seed=1):
+    # Writes data/<airac>/csv/* relative to the working directory; returns the folder
+    rng = random.Random(seed)
+    folder = os.path.dirname(source_path(airac, "x"))
+    os.makedirs(folder, exist_ok=True)
+    os.makedirs(f"data/{airac}/json", exist_ok=True)
+    counts = {name: int(count * scale) for name, count in COUNTS.items()}
+
+    fixes = idents(counts["fix"], 5, rng)
+    navs = idents(counts["nav"], 3, rng)
+    airports = idents(counts["apt"], 3, rng)
+
+    write_csv(
+        source_path(airac, "FIX_BASE.csv"),
+        ["EFF_DATE", "FIX_ID", "ICAO_REGION_CODE", "STATE_CODE", "COUNTRY_CODE", "LAT_DEG", "LAT_MIN", "LAT_SEC",
+         "LAT_HEMIS", "LAT_DECIMAL", "LONG_DEG", "LONG_MIN", "LONG_SEC", "LONG_HEMIS", "LONG_DECIMAL",
+         "FIX_ID_OLD", "CHARTING_REMARK", "FIX_USE_CODE", "ARTCC_ID_HIGH", "ARTCC_ID_LOW", "PITCH_FLAG",
+         "CATCH_FLAG", "SUA_ATCAA_FLAG", "MIN_RECEP_ALT", "COMPULSORY", "CHARTS"],
+        ((EFF_DATE, fix, "K5", "IL", "US", "", "", "", "N", lat, "", "", "", "W", lon, "", "", "WP",
+          rng.choice(ARTCCS), rng.choice(ARTCCS), "N", "N", "N", "", "", "IAP,SID,STAR")
+         for fix, (lat, lon) in ((fix, coordinate(rng)) for fix in fixes)),
+    )
+
+    # NAV_BASE names are Latin-1 in the real file
+    write_csv(
+        source_path(airac, "NAV_BASE.csv"),
+        ["EFF_DATE", "NAV_ID", "NAV_TYPE", "STATE_CODE", "CITY", "COUNTRY_CODE", "NAV_STATUS", "NAME",
+         "STATE_NAME", "REGION_CODE", "COUNTRY_NAME", "FAN_MARKER", "OWNER", "OPERATOR", "NAS_USE_FLAG",
+         "PUBLIC_USE_FLAG", "NDB_CLASS_CODE", "OPER_HOURS", "HIGH_ALT_ARTCC_ID", "HIGH_ARTCC_NAME",
+         "LOW_ALT_ARTCC_ID", "LOW_ARTCC_NAME", "LAT_DEG", "LAT_MIN", "LAT_SEC", "LAT_HEMIS", "LAT_DECIMAL",
+         "LONG_DEG", "LONG_MIN", "LONG_SEC", "LONG_HEMIS", "LONG_DECIMAL"],
+        ((EFF_DATE, nav, "VORTAC", "IL", "CHICAGO", "US", "OPERATIONAL IFR", rng.choice(NAV_NAMES), "ILLINOIS",
+          "AGL", "UNITED STATES", "", "FAA", "FAA", "Y", "Y", "", "24", "ZAU", "CHICAGO", "ZAU", "CHICAGO",
+          "", "", "", "N", lat, "", "", "", "W", lon)
+         for nav, (lat, lon) in ((nav, coordinate(rng)) for nav in navs)),
+        encoding="latin-1",
+    )
+
+    write_csv(
+        source_path(airac, "APT_BASE.csv"),
+        ["EFF_DATE", "SITE_NO", "SITE_TYPE_CODE", "STATE_CODE", "ARPT_ID", "CITY", "COUNTRY_CODE", "REGION_CODE",
+         "ADO_CODE", "STATE_NAME", "COUNTY_NAME", "COUNTY_ASSOC_STATE", "ARPT_NAME", "OWNERSHIP_TYPE_CODE",
+         "FACILITY_USE_CODE", "LAT_DEG", "LAT_MIN", "LAT_SEC", "LAT_HEMIS", "LAT_DECIMAL", "LONG_DEG",
+         "LONG_MIN", "LONG_SEC", "LONG_HEMIS", "LONG_DECIMAL", "ELEV"],
+        ((EFF_DATE, f"{n}.*A", "A", "IL", apt, "CHICAGO", "US", "AGL", "CHI", "ILLINOIS", "COOK", "IL",
+          f"{apt} MUNI", "PU", "PU", "", "", "", "N", lat, "", "", "", "W", lon, str(rng.randint(0, 9000)))
+         for n, (apt, (lat, lon)) in enumerate((apt, coordinate(rng)) for apt in airports)),
+    )
+
+    points = fixes + navs
+    airways = {}
+    for n in range(counts["awy"]):
+        airways[f"{rng.choice('JVQT')}{n}"] = rng.sample(points, rng.randint(3, 25))
+    write_csv(
+        source_path(airac, "AWY_BASE.csv"),
+        ["EFF_DATE", "REGULATORY", "AWY_LOCATION", "AWY_ID", "AWY_DESIGNATION", "UPDATE_DATE", "REMARK",
+         "AIRWAY_STRING"],
+        ((EFF_DATE, "N", "C", code, code[0], EFF_DATE, "", " ".join(awy)) for code, awy in airways.items()),
+    )
+
+    sid_base, sid_route = procedure_rows("sid", counts["sid"], fixes, airports, rng)
+    write_csv(
+        source_path(airac, "DP_BASE.csv"),
+        ["EFF_DATE", "DP_NAME", "AMENDMENT_NO", "ARTCC", "DP_AMEND_EFF_DATE", "RNAV_FLAG", "DP_COMPUTER_CODE",
+         "GRAPHICAL_DP_TYPE", "SERVED_ARPT"],
+        ((EFF_DATE, code.split(".")[0], "1", artcc, EFF_DATE, "Y", code, "", airport)
+         for code, artcc, airport in sid_base),
+    )
+    write_csv(
+        source_path(airac, "DP_RTE.csv"),
+        ["EFF_DATE", "DP_NAME", "ARTCC", "DP_COMPUTER_CODE", "ROUTE_PORTION_TYPE", "ROUTE_NAME", "BODY_SEQ",
+         "TRANSITION_COMPUTER_CODE", "POINT_SEQ", "POINT", "ICAO_REGION_CODE", "POINT_TYPE", "NEXT_POINT",
+         "ARPT_RWY_ASSOC"],
+        ((EFF_DATE, code.split(".")[0], artcc, code, portion, "", "1", transition, seq, point, "K5", "FIX", "",
+          runway)
+         for code, portion, transition, seq, point, runway, artcc in sid_route),
+    )
+
+    star_base, star_route = procedure_rows("star", counts["star"], fixes, airports, rng)
+    served = {}
+    for code, artcc, airport in star_base:
+        served.setdefault(code, (artcc, []))[1].append(airport)
+    write_csv(
+        source_path(airac, "STAR_BASE.csv"),
+        ["EFF_DATE", "ARRIVAL_NAME", "AMENDMENT_NO", "ARTCC", "STAR_AMEND_EFF_DATE", "RNAV_FLAG",
+         "STAR_COMPUTER_CODE", "SERVED_ARPT"],
+        ((EFF_DATE, code.split(".")[1], "1", artcc, EFF_DATE, "Y", code, " ".join(apts))
+         for code, (artcc, apts) in served.items()),
+    )
+    write_csv(
+        source_path(airac, "STAR_RTE.csv"),
+        ["EFF_DATE", "STAR_COMPUTER_CODE", "ARTCC", "ROUTE_PORTION_TYPE", "ROUTE_NAME", "BODY_SEQ",
+         "TRANSITION_COMPUTER_CODE", "POINT_SEQ", "POINT", "ICAO_REGION_CODE", "POINT_TYPE", "NEXT_POINT",
+         "ARPT_RWY_ASSOC"],
+        ((EFF_DATE, code, artcc, portion, "", "1", transition, seq, point, "K5", "FIX", "", runway)
+         for code, portion, transition, seq, point, runway, artcc in star_route),
+    )
+
+    # Prefroutes: DEP [SID TRANSITION] FIX AIRWAY FIX ... [TRANSITION STAR] DEST
+    sid_transitions = sorted({transition for _, portion, transition, *_ in sid_route if portion == "TRANSITION"})
+    star_transitions = sorted({transition for _, portion, transition, *_ in star_route if portion == "TRANSITION"})
+    codes = list(airways)
+
+    def route_string():
+        tokens = []
+        if sid_transitions and rng.random() < 0.4:
+            tokens += rng.choice(sid_transitions).split(".")
+        for _ in range(rng.randint(1, 3)):
+            code = rng.choice(codes)
+            entry, exit = rng.sample(airways[code], 2)
+            if not tokens or tokens[-1] != entry:
+                tokens.append(entry)
+            tokens += [code, exit]
+        if star_transitions and rng.random() < 0.4:
+            tokens += rng.choice(star_transitions).split(".")
+        return " ".join(tokens)
+
+    write_csv(
+        source_path(airac, "faa.csv"),
+        ["Orig", "Route String", "Dest", "Hours1", "Hours2", "Hours3", "Type", "Area", "Altitude", "Aircraft",
+         "Direction", "Seq", "DCNTR", "ACNTR"],
+        ((rng.choice(airports), route_string(), rng.choice(airports), "", "", "",
+          rng.choice(["L", "H", "LSD", "HSD", "SLD", "TEC"]), "", "", rng.choice(["", "", "JETS", "PROPS", "TURBOJETS"]),
+          rng.choice(["", "", "EAST", "WEST", "NORTH", "SOUTH"]), n, rng.choice(ARTCCS), rng.choice(ARTCCS))
+         for n in range(counts["faa"])),
+        encoding="utf-8-sig",
+    )
+
+    return folder
@@ -0,0 +1,75 @@
+from decimal import Decimal
+from diff import diff_records
+
+
+def fix(fix_id, lat, lon, nav_name=None):
+    return {"fix_id": fix_id, "lat": lat, "lon": lon, "nav_name": nav_name, "geohash": None}
+
+
+def route(dep, dest, text, id=None, **extra):
+    row = {"dep": dep, "dest": dest, "route": text, "altitude": None, "notes": "", "source": "faa", **extra}
+    if id is not None:
+        row["id"] = id
+    return row
+
+
+def test_keyed_table_added_removed_changed():
+    # Old rows as the database returns them (Decimals), new ones as the CSVs give them (strings)
+    old = [fix("AAAAA", Decimal("40.5"), Decimal("-73.25")), fix("BBBBB", Decimal("41"), Decimal("-74")),
+           fix("CCCCC", Decimal("42"), Decimal("-75"))]
+    new = [fix("AAAAA", "40.5", "-73.25"), fix("BBBBB", "41.1", "-74"), fix("DDDDD", "43", "-76")]
+
+    changes = diff_records("fix", old, new)
+
+    assert [row["fix_id"] for row in changes.inserts] == ["DDDDD"]
+    assert [row["fix_id"] for row in changes.updates] == ["BBBBB"]
+    assert changes.updates[0]["lat"] == "41.1"
+    assert changes.deletes == ["CCCCC"]
+
+
+def test_unchanged_rows_give_an_empty_diff():
+    old = [{"awy_code": "J60", "fixes": ["AAAAA", "BBBBB"]}]
+    new = [{"awy_code": "J60", "fixes": ["AAAAA", "BBBBB"]}]
+
+    assert diff_records("airway", old, new) == ([], [], [])
+
+
+def test_list_order_is_a_change():
+    old = [{"sid_code": "KAYLN3.KAYLN", "fixes": ["A", "B"], "apts": ["JFK"]}]
+    new = [{"sid_code": "KAYLN3.KAYLN", "fixes": ["B", "A"], "apts": ["JFK"]}]
+
+    assert [row["sid_code"] for row in diff_records("sid", old, new).updates] == ["KAYLN3.KAYLN"]
+
+
+def test_duplicate_new_keys_first_row_wins():
+    new = [fix("AAAAA", "40", "-73"), fix("AAAAA", "50", "-80")]
+
+    changes = diff_records("fix", [], new)
+
+    assert len(changes.inserts) == 1
+    assert changes.inserts[0]["lat"] == "40"
+
+
+def test_routes_are_matched_as_a_multiset():
+    # Routes have no key: identical routes pair up, the extra copy is deleted by id
+    old = [route("JFK", "BOS", "MERIT J60", id=1), route("JFK", "BOS", "MERIT J60", id=2),
+           route("JFK", "DCA", "WHITE J209", id=3)]
+    new = [route("JFK", "BOS", "MERIT J60"), route("JFK", "DCA", "WHITE J209 SBY"),
+           route("JFK", "PHL", "DIXIE", aircraft="JETS")]
+
+    changes = diff_records("route", old, new)
+
+    # one of the two JFK-BOS copies, and the changed JFK-DCA route
+    assert len(changes.deletes) == 2 and 3 in changes.deletes and {1, 2} & set(changes.deletes)
+    assert [row["route"] for row in changes.inserts] == ["WHITE J209 SBY", "DIXIE"]
+    assert changes.updates == []
+
+
+def test_route_qualifiers_are_compared():
+    old = [route("JFK", "BOS", "MERIT J60", id=1, aircraft="JETS")]
+    new = [route("JFK", "BOS", "MERIT J60", aircraft="PROPS")]
+
+    changes = diff_records("route", old, new)
+
+    assert changes.deletes == [1]
+    assert len(changes.inserts) == 1
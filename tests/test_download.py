@@ -0,0 +1,82 @@
+import asyncio, json
+import httpx
+import pytest
+import download
+
+URL = "https://example.com/nasr.zip"
+BODY = bytes(range(256)) * 40
+ETAG = '"v1"'
+
+
+def serve(requests, status_for=None):
+    # Serves BODY with Range support; status_for(request) can force a status
+    def handler(request):
+        requests.append(request)
+        if status_for and (status := status_for(request)):
+            return httpx.Response(status)
+        headers = {"etag": ETAG}
+        # If-Range: a changed file is sent whole instead of the range
+        if "range" in request.headers and request.headers.get("if-range", ETAG) == ETAG:
+            start = int(request.headers["range"].removeprefix("bytes=").rstrip("-"))
+            if start >= len(BODY):
+                return httpx.Response(416)
+            headers["content-range"] = f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"
+            return httpx.Response(206, headers=headers, content=BODY[start:])
+        return httpx.Response(200, headers=headers, content=BODY)
+    return httpx.MockTransport(handler)
+
+
+def run(transport, path, **kwargs):
+    async def go():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await download.download(client, URL, str(path), backoff=0, **kwargs)
+    return asyncio.run(go())
+
+
+def partial(path, size, total=len(BODY)):
+    with open(f"{path}.part", "wb") as f:
+        f.write(BODY[:size])
+    with open(f"{path}.part.json", "w", encoding="utf-8") as f:
+        json.dump({"url": URL, "etag": ETAG, "total": total}, f)
+
+
+def test_resumes_partial_file_with_206(tmp_path):
+    path, requests = tmp_path / "nasr.zip", []
+    partial(path, 1000)
+
+    assert run(serve(requests), path) == str(path)
+    assert path.read_bytes() == BODY
+    assert requests[0].headers["range"] == "bytes=1000-"
+    assert requests[0].headers["if-range"] == ETAG
+    assert not (tmp_path / "nasr.zip.part").exists()
+    assert not (tmp_path / "nasr.zip.part.json").exists()
+
+
+def test_416_on_complete_part_file_finishes(tmp_path):
+    path, requests = tmp_path / "nasr.zip", []
+    partial(path, len(BODY))
+
+    assert run(serve(requests), path) == str(path)
+    assert path.read_bytes() == BODY
+    assert len(requests) == 1
+
+
+def test_changed_file_starts_over(tmp_path):
+    path, requests = tmp_path / "nasr.zip", []
+    partial(path, 1000)
+    with open(f"{path}.part.json", "w", encoding="utf-8") as f:
+        json.dump({"url": URL, "etag": '"v0"', "total": len(BODY)}, f)
+
+    assert run(serve(requests), path) == str(path)
+    assert path.read_bytes() == BODY
+    assert requests[0].headers["if-range"] == '"v0"'
+
+
+def test_416_until_retries_run_out_raises(tmp_path):
+    path, requests = tmp_path / "nasr.zip", []
+    partial(path, 1000)
+
+    with pytest.raises(download.DownloadError):
+        run(serve(requests, lambda request: 416), path, retries=2)
+    assert len(requests) == 3
+    assert not path.exists()
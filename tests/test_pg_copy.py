@@ -0,0 +1,12 @@
+from pg_copy import asyncpg_url, server_settings
+
+
+def test_prisma_params_are_dropped_from_the_url():
+    url = "postgresql://u:p@db:5432/nav?schema=nav&connection_limit=4&sslmode=require"
+
+    assert asyncpg_url(url) == "postgresql://u:p@db:5432/nav?sslmode=require"
+
+
+def test_schema_becomes_the_search_path():
+    assert server_settings("postgresql://u:p@db/nav?schema=nav&pgbouncer=true") == {"search_path": "nav"}
+    assert server_settings("postgresql://u:p@db/nav") == {}
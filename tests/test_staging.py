@@ -0,0 +1,127 @@
+import asyncio, json
+import pytest
+import staging
+
+
+class Recorder:
+    # Stands in for the Prisma client (and its transactions): records the SQL
+    # and answers to_regclass() for the tables in `existing`
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.statements = []
+        self.transactions = 0
+
+    async def execute_raw(self, query, *args):
+        self.statements.append(query)
+        return len(json.loads(args[0])) if args else 0
+
+    async def query_raw(self, query, name):
+        return [{"name": name if name in self.existing else None}]
+
+    def tx(self, timeout=None):
+        recorder = self
+
+        class Tx:
+            async def __aenter__(self):
+                recorder.transactions += 1
+                return recorder
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Tx()
+
+
+@pytest.fixture(autouse=True)
+def swap_record(tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, "SWAP_RECORD", str(tmp_path / "last-swap.json"))
+
+
+def test_stage_table_statements():
+    db = Recorder()
+    rows = [{"fix_id": "AAAAA", "lat": "40", "lon": "-73", "nav_name": None, "geohash": "dr5reg"}]
+
+    asyncio.run(staging.stage_table(db, "fix", iter(rows)))
+
+    assert db.statements[:2] == [
+        'DROP TABLE IF EXISTS "Fix_new"',
+        'CREATE UNLOGGED TABLE "Fix_new" (LIKE "Fix" INCLUDING DEFAULTS)',
+    ]
+    assert db.statements[2].startswith('INSERT INTO "Fix_new" (')
+    assert "json_populate_recordset" in db.statements[2]
+    assert db.statements[3:] == [
+        'ALTER TABLE "Fix_new" SET LOGGED',
+        'ALTER TABLE "Fix_new" ADD CONSTRAINT "Fix_new_pkey" PRIMARY KEY ("fix_id")',
+        'CREATE INDEX "Fix_new_geohash_idx" ON "Fix_new" ("geohash")',
+        'ANALYZE "Fix_new"',
+    ]
+
+
+def test_prepare_keeps_custom_routes():
+    db = Recorder()
+
+    asyncio.run(staging.prepare(db, "route"))
+
+    assert db.statements[-1] == 'INSERT INTO "Route_new" SELECT * FROM "Route" WHERE "source" <> \'faa\''
+
+
+def test_swap_renames_in_one_transaction():
+    db = Recorder()
+
+    asyncio.run(staging.swap(db, ["route"]))
+
+    assert db.transactions == 1
+    assert db.statements == [
+        'DROP TABLE IF EXISTS "Route_prev"',
+        'ALTER TABLE "Route" RENAME TO "Route_prev"',
+        'ALTER TABLE "Route_prev" RENAME CONSTRAINT "Route_pkey" TO "Route_prev_pkey"',
+        'ALTER INDEX "Route_dep_dest_idx" RENAME TO "Route_prev_dep_dest_idx"',
+        'ALTER INDEX "Route_dep_artcc_dest_artcc_idx" RENAME TO "Route_prev_dep_artcc_dest_artcc_idx"',
+        'ALTER TABLE "Route_new" RENAME TO "Route"',
+        'ALTER TABLE "Route" RENAME CONSTRAINT "Route_new_pkey" TO "Route_pkey"',
+        'ALTER INDEX "Route_new_dep_dest_idx" RENAME TO "Route_dep_dest_idx"',
+        'ALTER INDEX "Route_new_dep_artcc_dest_artcc_idx" RENAME TO "Route_dep_artcc_dest_artcc_idx"',
+        'ALTER SEQUENCE "Route_id_seq" OWNED BY "Route"."id"',
+    ]
+
+
+def test_rollback_swaps_prev_back_and_skips_missing():
+    db = Recorder(existing={'"Sid_prev"'})
+
+    assert asyncio.run(staging.rollback(db, ["sid", "star"])) == ["sid"]
+    assert db.statements == [
+        'ALTER TABLE "Sid" RENAME TO "Sid_tmp"',
+        'ALTER TABLE "Sid_tmp" RENAME CONSTRAINT "Sid_pkey" TO "Sid_tmp_pkey"',
+        'ALTER TABLE "Sid_prev" RENAME TO "Sid"',
+        'ALTER TABLE "Sid" RENAME CONSTRAINT "Sid_prev_pkey" TO "Sid_pkey"',
+        'ALTER TABLE "Sid_tmp" RENAME TO "Sid_prev"',
+        'ALTER TABLE "Sid_prev" RENAME CONSTRAINT "Sid_tmp_pkey" TO "Sid_prev_pkey"',
+    ]
+
+
+def test_prepare_swap_rollback_sequence():
+    # A swap followed by a rollback puts every name back where it started
+    db = Recorder(existing={'"Star_prev"'})
+
+    async def cycle():
+        await staging.stage_table(db, "star", iter([]))
+        await staging.swap(db, ["star"])
+        await staging.rollback(db, ["star"])
+
+    asyncio.run(cycle())
+    renames = [s for s in db.statements if s.startswith('ALTER TABLE') and "RENAME TO" in s]
+    assert renames == [
+        'ALTER TABLE "Star" RENAME TO "Star_prev"',
+        'ALTER TABLE "Star_new" RENAME TO "Star"',
+        'ALTER TABLE "Star" RENAME TO "Star_tmp"',
+        'ALTER TABLE "Star_prev" RENAME TO "Star"',
+        'ALTER TABLE "Star_tmp" RENAME TO "Star_prev"',
+    ]
+
+
+def test_swap_record_roundtrip():
+    assert staging.read_swap_record() is None
+    staging.write_swap_record("2603", ["route"])
+    assert staging.read_swap_record() == {"airac": "2603", "tables": ["route"]}
+    staging.clear_swap_record()
+    assert staging.read_swap_record() is None
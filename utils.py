@@ -1,17 +1,49 @@
-import csv, json
+import codecs, csv, json
+from itertools import islice
 
-def csv_to_json(input_csv, output_json, fields_to_keep):
-    # Read CSV and convert to JSON
-    data = []
-    with open(input_csv, newline='', encoding='utf-8-sig') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            # Keep only the selected fields
-            filtered = {field: row[field] for field in fields_to_keep if field in row}
-            data.append(filtered)
+def decoded_lines(path):
+    # Decode a file line by line while streaming it: UTF-8 (with or without a
+    # BOM) where it is valid, Latin-1 otherwise (NAV_BASE has Latin-1 names).
+    # Lines keep their endings, as csv expects from newline=''.
+    with open(path, "rb") as f:
+        first = True
+        for line in f:
+            if first:
+                first = False
+                if line.startswith(codecs.BOM_UTF8):
+                    line = line[len(codecs.BOM_UTF8):]
+            try:
+                yield line.decode("utf-8")
+            except UnicodeDecodeError:
+                yield line.decode("latin-1")
+
+def iter_csv(input_csv, fields_to_keep):
+    # Stream CSV rows, keeping only the selected fields
+    reader = csv.DictReader(decoded_lines(input_csv))
+    for row in reader:
+        yield {field: row[field] for field in fields_to_keep if field in row}
+
+def batched(iterable, size):
+    # Split any iterable into lists of at most `size` items without materializing it
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
 
-    # Write JSON output
+def write_json(rows, output_json, batch_size=1000):
+    # Same output as json.dump(list(rows), indent=4), encoded a batch at a
+    # time so rows can be a generator
+    count = 0
     with open(output_json, "w", encoding="utf-8") as jsonfile:
-        json.dump(data, jsonfile, indent=4)
+        jsonfile.write("[")
+        for batch in batched(rows, batch_size):
+            # the batch's items without its own brackets
+            jsonfile.write(",\n" if count else "\n")
+            jsonfile.write(json.dumps(batch, indent=4)[2:-2])
+            count += len(batch)
+        jsonfile.write("\n]" if count else "]")
 
-    print(f"Successfully wrote {len(data)} records to {output_json}")
\ No newline at end of file
+    print(f"Successfully wrote {count} records to {output_json}")
+
+def csv_to_json(input_csv, output_json, fields_to_keep):
+    # Stream CSV rows into JSON without holding the file in memory
+    write_json(iter_csv(input_csv, fields_to_keep), output_json)
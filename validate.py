@@ -0,0 +1,138 @@
+import json, os
+from collections import Counter
+import metrics
+from expand import first_by_name
+
+# Referential checks on a parsed cycle, run before it is loaded: every fix in
+# an airway or procedure, and every token of a preferred route, has to resolve
+# to a fix/navaid, airport, airway or procedure of the same cycle. The known
+# identifiers are built into sets once and each table's tokens are checked
+# with one set difference over its distinct tokens, so only the rows holding
+# an unknown token are looked at individually.
+#
+# A table fails when more than THRESHOLD of its rows have unresolved tokens;
+# a failing cycle raises ValidationError, which stops the load. The full
+# report goes to data/<airac>/validation.json either way.
+
+# ---- CONFIG ----
+THRESHOLD = float(os.getenv("VALIDATION_THRESHOLD", "0.05"))  # share of rows, 1 disables the check
+EXAMPLES = 20  # failing rows and unknown tokens kept per check in the report
+# ----------------
+
+# Route tokens that aren't identifiers
+ROUTE_KEYWORDS = {"DCT"}
+
+
+class ValidationError(Exception):
+    def __init__(self, report, path=None):
+        failed = [name for name, check in report["checks"].items() if not check["ok"]]
+        super().__init__(f"Validation failed for {', '.join(failed)} (threshold {report['threshold']:.1%})")
+        self.report = report
+        self.path = path  # of the full report
+
+
+def failure_summary(report):
+    # One line per failing check, for the CLI and the daemon's log
+    return "\n".join(
+        f"  {name}: {check['failed_rows']} of {check['rows']} rows unresolved ({check['failed_rate']:.2%})"
+        + (f", e.g. {', '.join(check['unknown_tokens'])}" if check["unknown_tokens"] else "")
+        for name, check in report["checks"].items() if not check["ok"]
+    )
+
+
+def report_path(airac):
+    return f"data/{airac}/validation.json"
+
+
+def check(name, keyed_tokens, valid, threshold):
+    # keyed_tokens: [(row key, [tokens])]; valid: set of identifiers that resolve
+    distinct = set()
+    for _, tokens in keyed_tokens:
+        distinct.update(tokens)
+    unknown = distinct - valid
+
+    failing = [(key, [t for t in tokens if t in unknown]) for key, tokens in keyed_tokens
+               if not unknown.isdisjoint(tokens)]
+    counts = Counter(t for _, tokens in failing for t in tokens)
+    rate = len(failing) / len(keyed_tokens) if keyed_tokens else 0.0
+
+    return {
+        "check": name,
+        "rows": len(keyed_tokens),
+        "failed_rows": len(failing),
+        "failed_rate": round(rate, 6),
+        "ok": rate <= threshold,
+        "unknown_tokens": dict(counts.most_common(EXAMPLES)),
+        "examples": [{"key": key, "unresolved": tokens} for key, tokens in failing[:EXAMPLES]],
+    }
+
+
+def transition_names(kind, rows, key):
+    # A SID transition is named after the fix it ends at (NAME.FIX), a STAR
+    # transition after the one it starts at (FIX.NAME); anything else means
+    # the wrong body was attached or the points came out in the wrong order
+    keyed = []
+    for row in rows:
+        parts = row[key].split(".")
+        if len(parts) != 2 or not row["fixes"]:
+            continue
+        name, fix = (parts[0], parts[1]) if kind == "sid" else (parts[1], parts[0])
+        # bodies are named after the procedure itself (KAYLN3.KAYLN)
+        if name.rstrip("0123456789") == fix:
+            continue
+        end = row["fixes"][-1] if kind == "sid" else row["fixes"][0]
+        keyed.append((row[key], [f"{fix}!={end}"] if end != fix else []))
+    return keyed
+
+
+def validate(tables, threshold=THRESHOLD):
+    # tables: {table: [rows]} for fix, airport, airway, sid, star and route
+    fixes = {row["fix_id"] for row in tables["fix"]}
+    airports = {row["code"] for row in tables["airport"]}
+    airways = {row["awy_code"] for row in tables["airway"]}
+    sids = {row["sid_code"] for row in tables["sid"]}
+    stars = {row["star_code"] for row in tables["star"]}
+    procedures = sids | stars | set(first_by_name(sids, 0)) | set(first_by_name(stars, 1))
+    points = fixes | airports
+
+    checks = {
+        "airway": check("airway fixes", [(row["awy_code"], row["fixes"]) for row in tables["airway"]],
+                        points, threshold),
+        "sid": check("sid fixes", [(row["sid_code"], row["fixes"]) for row in tables["sid"]], points, threshold),
+        "star": check("star fixes", [(row["star_code"], row["fixes"]) for row in tables["star"]], points, threshold),
+        "sid_transitions": check("sid transition ends", transition_names("sid", tables["sid"], "sid_code"),
+                                 set(), threshold),
+        "star_transitions": check("star transition starts", transition_names("star", tables["star"], "star_code"),
+                                  set(), threshold),
+        "route": check(
+            "route tokens",
+            [(f"{row['dep']}-{row['dest']} {row['route']}", (row["route"] or "").split()) for row in tables["route"]],
+            points | airways | procedures | ROUTE_KEYWORDS,
+            threshold,
+        ),
+    }
+
+    metrics.add(rows_in=sum(c["rows"] for c in checks.values()),
+                rows_out=sum(c["failed_rows"] for c in checks.values()))
+    return {"threshold": threshold, "ok": all(c["ok"] for c in checks.values()), "checks": checks}
+
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in report["checks"].items():
+        status = "ok" if result["ok"] else "FAIL"
+        print(f"  {name:<17} {result['failed_rows']:>7} of {result['rows']:>7} rows unresolved "
+              f"({result['failed_rate']:.2%})  {status}")
+    print(f"Validation report written to {path}")
+
+
+def validate_cycle(airac, tables, threshold=THRESHOLD):
+    # Validate, write the report and raise ValidationError if the cycle is over the threshold
+    with metrics.stage("validate"):
+        report = validate(tables, threshold)
+    write_report(report, report_path(airac))
+    if not report["ok"]:
+        raise ValidationError(report, report_path(airac))
+    return report